@@ -0,0 +1,184 @@
+""" Compression
+Transparent streaming compression for the logs and traces that are kept
+(Spike logs, RTL logs, transition logs, trace CSVs). The method follows the
+file name: .gz, .xz/.lzma, .bz2 and .zst (the last one needs the zstandard
+package). Readers detect compressed input by its magic bytes whatever the
+name, so parsers take compressed files directly. Compressed writers hand
+their data to a background thread, compression never runs on the thread that
+writes the trace.
+
+PROCESSORFUZZ_COMPRESS (gz, xz, bz2, zst) selects the method record_path()
+appends to the names of kept files, they are stored uncompressed by default.
+"""
+
+import os
+import bz2
+import gzip
+import lzma
+import queue
+import atexit
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+OPENERS = { '.gz': gzip.open, '.xz': lzma.open, '.lzma': lzma.open, '.bz2': bz2.open }
+if zstandard is not None:
+    OPENERS['.zst'] = zstandard.open
+
+MAGIC = [ (b'\x1f\x8b', '.gz'), (b'\xfd7zXZ\x00', '.xz'), (b'BZh', '.bz2'),
+          (b'\x28\xb5\x2f\xfd', '.zst') ]
+
+def suffix(path):
+    ext = os.path.splitext(path)[1]
+    return ext if ext in OPENERS or ext == '.zst' else ''
+
+def sniff(path):
+    """Compression suffix matching the first bytes of the file, '' if none"""
+    try:
+        with open(path, 'rb') as fd:
+            head = fd.read(6)
+    except OSError:
+        return suffix(path)
+    for (magic, ext) in MAGIC:
+        if head.startswith(magic):
+            return ext
+    return ''
+
+def _opener(ext, path):
+    if ext == '.zst' and zstandard is None:
+        raise ImportError('{} is zstd compressed, install zstandard to read it'.format(path))
+    return OPENERS[ext]
+
+def record_path(path, method=None):
+    """Name of a kept file, with the suffix of the configured method"""
+    method = method if method is not None else os.environ.get('PROCESSORFUZZ_COMPRESS', '')
+    if not method or method == 'none':
+        return path
+    ext = '.' + method.lstrip('.')
+    if ext not in OPENERS:
+        print('[ProcessorFuzz] Compression {} not available, {} is stored uncompressed'.format(method, path))
+        return path
+    return path + ext
+
+def open_trace(path, mode='r', newline=None, background=True):
+    """open() that compresses and decompresses transparently
+
+    Text mode only. Compressed writes go through a BackgroundWriter unless
+    background is False.
+    """
+    if 'r' in mode:
+        ext = sniff(path)
+        if not ext:
+            return open(path, mode, newline=newline)
+        return _opener(ext, path)(path, 'rt', newline=newline)
+
+    ext = suffix(path)
+    if not ext:
+        return open(path, mode, newline=newline)
+    opener = _opener(ext, path)
+    mode = mode.replace('t', '').replace('b', '') + 't'
+    if not background:
+        return opener(path, mode, newline=newline)
+    return BackgroundWriter(lambda: opener(path, mode, newline=newline))
+
+
+class BackgroundWriter():
+    """File-like writer whose writes are done by a thread
+
+    Writes are buffered into chunks of about chunk characters, the thread
+    compresses and writes them to the file open_fd() returns.
+    """
+    def __init__(self, open_fd, chunk=1 << 16, depth=64):
+        self.fd = open_fd()
+        self.chunk = chunk
+        self.buffer = []
+        self.size = 0
+        self.error = None
+        self.closed = False
+
+        self.pending = queue.Queue(maxsize=depth)
+        self.thread = threading.Thread(target=self._write, name='trace-writer', daemon=True)
+        self.thread.start()
+
+    def _write(self):
+        while True:
+            data = self.pending.get()
+            if data is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.fd.write(data)
+                if self.pending.empty():
+                    self.fd.flush()
+            except OSError as e:
+                self.error = e
+        try:
+            self.fd.close()
+        except OSError as e:
+            self.error = self.error or e
+
+    def write(self, data):
+        if self.error is not None:
+            raise self.error
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= self.chunk:
+            self.flush()
+        return len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self.buffer:
+            self.pending.put(''.join(self.buffer))
+            self.buffer = []
+            self.size = 0
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self.pending.put(None)
+        self.thread.join()
+        self.closed = True
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Long-lived appenders (transition log segments), closed when the fuzzer exits
+shared_writers = {}
+shared_lock = threading.Lock()
+
+def shared_writer(path):
+    """Append-mode writer kept open across calls, compressed by the path's suffix"""
+    with shared_lock:
+        fd = shared_writers.get(path)
+        if fd is None:
+            ext = suffix(path)
+            if ext:
+                opener = _opener(ext, path)
+                fd = BackgroundWriter(lambda: opener(path, 'at'))
+            else:
+                fd = BackgroundWriter(lambda: open(path, 'a'))
+            shared_writers[path] = fd
+        return fd
+
+def close_shared_writers():
+    with shared_lock:
+        for fd in shared_writers.values():
+            fd.close()
+        shared_writers.clear()
+
+atexit.register(close_shared_writers)
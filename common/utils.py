@@ -1,9 +1,7 @@
 import os
 import shutil
-import psutil
 import signal
 import csv
-from threading import Timer
 import struct
 import binascii
 import math
@@ -20,12 +18,18 @@ from execution.preprocessor import rvPreProcessor
 from execution.signature_checker import sigChecker
 from mutation.mutator import simInput, rvMutator
 from execution.multicore_manager import proc_state, procManager
+from common.constants import TIME_OUT
+from execution.isa_trace import IsaTrace
+from common.compression import open_trace
+from coverage.transition_store import TransitionStore
+from coverage.csr_vector import preset as csr_preset
+from coverage.transition_log import transition_log
+from coverage.shared_transition_store import SharedTransitionStore
 
 ISA_TIME_LIMIT = 1
 
-comb_t = []
-comb_priv = []
-comb_func = []
+# Transitions seen by this worker
+transition_store = TransitionStore()
 instrs = []
 
 reg_map = {
@@ -108,8 +112,9 @@ ignore_list = ['csrw    minstret', 'mret', 'sret', 'ebreak', 'csrw    mepc', 'cs
 def get_FS(mstatus):
     return ((int(mstatus, 16)>>13)&3)
 def trace_compare(isa_csv, rtl_log, toplevel, strategy=''):
+    # -1 on a mismatch, 0 if the traces match, -2 if the comparison did not complete
 
-    rtl_f = open(rtl_log, 'r')
+    rtl_f = open_trace(rtl_log, 'r')
     rtl_lines = rtl_f.readlines()
     rtl_f.close() 
     rtl_trace_idx = 1 # skip the first line with headers
@@ -143,15 +148,19 @@ def trace_compare(isa_csv, rtl_log, toplevel, strategy=''):
         #if rtl_lines[x].split()[2][10:]=='80000000':
             rtl_trace_start = x
             break
-    isa_f = open(isa_csv, 'r') 
+    # isa_csv is a trace CSV or the IsaTrace it would be exported from
+    if isinstance(isa_csv, IsaTrace):
+        isa_rows = isa_csv.rows()
+    else:
+        with open_trace(isa_csv, 'r') as isa_f:
+            isa_rows = csv.reader(isa_f)
+            next(isa_rows, None)
+            isa_rows = list(isa_rows)
     try:
     #if True:
-        isa_csv = csv.reader(isa_f)
-        next(isa_csv, None)
-        isa_csv = list(isa_csv)
+        isa_csv = isa_rows
         if rtl_trace_len == 1: #only the header is available
             print("ERROR: Empty RTL trace file - ",rtl_log)
-            isa_f.close()
             return -1
          
         for j in range(len(isa_csv[isa_idx_offset:])): # skip the first line with headers
@@ -236,7 +245,6 @@ def trace_compare(isa_csv, rtl_log, toplevel, strategy=''):
                 #dcsr_rtl = rtl_line[6]
             if pc_isa!=pc_rtl:
                 print("PC MISMATCH: ISA - {}, RTL - {}".format(pc_isa,pc_rtl))
-                isa_f.close()
                 return_val = -1
                 if scause_rtl=='f' and mcause_isa=='6':
                     print("Bug 14: Rocket exception priority is incorrect when store page fault and store misaligned address exceptions are generated")
@@ -382,10 +390,10 @@ def trace_compare(isa_csv, rtl_log, toplevel, strategy=''):
                 #break
             if not_found:
                 print("INSTRUCTION NOT FOUND: {}\n\t\t\tPC\t\t\tINSTR\t\tMODE\tWDATA \nISA:\t\t{}\t{}\t{}\t\t{}\n".format(instr_str_isa,pc_isa,instr_isa,mode_isa,wdata_isa))
-                isa_f.close()
+                if return_val == 0:
+                    return_val = -2
                 break
             if return_val==-2:
-                isa_f.close()
                 break
             #if j==len(isa_csv[isa_idx_offset:])-1 and not mismatch and initial:
             #    print("[COMPARISON PASSED]")
@@ -394,213 +402,40 @@ def trace_compare(isa_csv, rtl_log, toplevel, strategy=''):
             #k = k + 1
     except:
         print("ERROR: Trace comparison did not complete")
-    isa_f.close()
+        if return_val == 0:
+            return_val = -2
     return return_val
 
-def extract_transitions(i_file, out, it, ALL_CSR, FP_CSR):
-	fd = open(i_file, "r")
-	fdb = open(out+"/transition.db","a")	
-	lines = fd.readlines()
-	fd.close()
-	init = True
-	count = 0
-	duplic = []
-	transitions = []
-	csr_names = ['mstatus', 'mcause', 'scause', 'fflags']
-	csr = ''
+def share_transitions(out, **kwargs):
+	"""Use the node-wide transition table of the campaign in out from now on"""
+	global transition_store
+	transition_store = SharedTransitionStore(out, **kwargs)
+	return transition_store
+
+def extract_transitions(i_file, out, it, ALL_CSR, FP_CSR, vector=None, **meta):
+	# i_file is a Spike log or the IsaTrace already parsed from it
+	if isinstance(i_file, IsaTrace):
+		trace = i_file
+	else:
+		trace = IsaTrace.read(i_file)
+	# CSRs tracked and novelty rules, the ALL_CSR / FP_CSR preset by default
+	if vector is None:
+		vector = csr_preset(ALL_CSR, FP_CSR)
+	# Segment of this worker, records are written in batches (see transition_log)
+	log = transition_log(out)
+	count = len(trace)
 	j = 0
-	skip = False
-	for l in lines:
-		if '[' not in l:
-			continue
-		count = count + 1
-		vals = l.split('[')[1].split(']')[0]
-		instr = l.split('[')[1].split(']')[1].rstrip()
-		vals = vals.split(',')
-		mstatus = vals[0]
-		frm = vals[1]
-		fflags = vals[2]
-		mcause = vals[3]
-		scause = vals[4]
-		medeleg =  vals[5] #Set this to zero for some experiments vals[5]
-		mcounteren = vals[6]
-		scounteren = vals[7]
-		#dcsr = vals[8]
-		if ALL_CSR:
-			dcsr = vals[8]
-			misa = vals[9]
-			mhartid = vals[10]
-			mip = vals[11]
-			mie = vals[12]
-			mideleg = vals[13]
-			mepc = vals[14]
-			mtval = vals[15]
-			mtvec = vals[16]
-			mscratch = vals[17]
-			sstatus = vals[18]
-			sip = vals[19]
-			sie = vals[20]
-			sepc = vals[21]
-			stval = vals[22]
-			sscratch = vals[23]
-			satp = vals[24]
-			stvec = vals[25]
-			dpc = vals[26]
-			tselect = vals[27]
-			tdata1 = vals[28]
-			tdata2 = vals[29]
-			tdata3 = vals[30]
-			mcountinhibit = vals[31]
-			cycle = vals[32]
-			instret = vals[33]
-			mhpmevent = vals[34]
-			mhpmcounter = vals[35]
-			vstart = vals[36]
-			vxsat = vals[37]
-			vxrm = vals[38]
-			pmpcfg = vals[39]
-			pmpaddr = vals[40]
-		
-		pc = l.split()[2]
-
-		if init:
-			init = False
-		elif ALL_CSR:
-			if (mstatus_p != mstatus) or (frm_p != frm) or (fflags_p != fflags) or (mcause_p != mcause) or (scause_p != scause) or (medeleg_p != medeleg) or (mcounteren_p != mcounteren) or (scounteren_p != scounteren) or (dcsr_p != dcsr) or (misa_p != misa) or (mhartid_p != mhartid) or (mip_p != mip) or (mie_p != mie) or (mideleg_p != mideleg) or (mepc_p != mepc) or (mtval_p != mtval) or (mtvec_p != mtvec) or (mscratch_p != mscratch) or (sstatus_p != sstatus) or (sip_p != sip) or (sie_p != sie) or (sepc_p != sepc) or (stval_p != stval) or (sscratch_p != sscratch) or (satp_p != satp) or (stvec_p != stvec) or (dpc_p != dpc) or (tselect_p != tselect) or (tdata1_p != tdata1) or (tdata2_p != tdata2) or (tdata3_p != tdata3) or (mcountinhibit_p != mcountinhibit) or (cycle_p != cycle) or (instret_p != instret) or (mhpmevent_p != mhpmevent) or (mhpmcounter_p != mhpmcounter) or (vstart_p != vstart) or (vxsat_p != vxsat) or (vxrm_p != vxrm) or (pmpcfg_p != pmpcfg) or (pmpaddr_p != pmpaddr):
-				comp = mstatus+frm+fflags+mcause+scause+medeleg+mcounteren+scounteren+dcsr+misa+mhartid+mip+mie+mideleg+mepc+mtval+mtvec+mscratch+sstatus+sip+sie+sepc+stval+sscratch+satp+stvec+dpc+tselect+tdata1+tdata2+tdata3+mcountinhibit+cycle+instret+mhpmevent+mhpmcounter+vstart+vxsat+vxrm+pmpcfg+pmpaddr
-				comp_p = mstatus_p+frm_p+fflags_p+mcause_p+scause_p+medeleg_p+mcounteren_p+scounteren_p+dcsr_p+misa_p+mhartid_p+mip_p+mie_p+mideleg_p+mepc_p+mtval_p+mtvec_p+mscratch_p+sstatus_p+sip_p+sie_p+sepc_p+stval_p+sscratch_p+satp_p+stvec_p+dpc_p+tselect_p+tdata1_p+tdata2_p+tdata3_p+mcountinhibit_p+cycle_p+instret_p+mhpmevent_p+mhpmcounter_p+vstart_p+vxsat_p+vxrm_p+pmpcfg_p+pmpaddr_p
-				instr_t = instr_p.split()[0].strip()
-				if (instr_t, comp_p, comp) not in comb_t:
-					comb_t.append((instr_t, comp_p, comp))
-					j += 1
-		elif (mstatus_p != mstatus) or (frm_p != frm) or (fflags_p != fflags) or (mcause_p != mcause) or (scause_p != scause) or (medeleg_p != medeleg) or (mcounteren_p != mcounteren) or (scounteren_p != scounteren): #or (dcsr_p != dcsr):
-			t = (pc_p + '\t' + mstatus_p +','+frm_p+','+fflags_p+','+mcause_p+','+scause_p+','+medeleg_p+','+mcounteren_p+','+scounteren_p+' '+instr_p, pc + '\t' + mstatus +','+frm+','+fflags+','+mcause+','+scause+','+medeleg+','+mcounteren+','+scounteren+' '+instr)
-			comb = mstatus+frm+fflags+mcause+scause+medeleg+mcounteren+scounteren
-			comb_p = mstatus_p+frm_p+fflags_p+mcause_p+scause_p+medeleg_p+mcounteren_p+scounteren_p
-			comb_pr   = mstatus+mcause+scause+medeleg+mcounteren+scounteren
-			comb_pr_p = mstatus_p+mcause_p+scause_p+medeleg_p+mcounteren_p+scounteren_p
-			comb_f   = str((int(mstatus,16)>>13) & 3) +frm+fflags
-			comb_f_p = str((int(mstatus_p,16)>>13) & 3) +frm_p+fflags_p
-			instr_t = instr_p.split()[0].strip()
-			csr = ''
-			skip = False
-			#instr = instr_p.split()[0].strip()
-			if 'csrr' in instr_p: #Ex: csrrsi  a2, frm, 25
-				#print(instr_p)
-				instr_t += ' ' + instr_p.split(',')[1].strip() #Ex: csrrsi frm
-				csr = instr_p.split(',')[1].strip()
-			elif instr_t in ['csrw', 'csrs', 'csrc', 'csrwi', 'csrsi', 'csrci']:
-				instr_t = ' '.join(instr_p.split(',')[0].split())
-				csr = instr_p.split(',')[0].split()[1]
-			if csr=='sstatus': csr = 'mstatus' #Treat mstatus same as sstatus
-			if csr in csr_names:
-				csr_n = []
-				csr_l0 = [mstatus, mcause, scause, fflags]
-				csr_l1 = [mstatus_p, mcause_p, scause_p, fflags_p]
-				csr_l = []
-
-				for i in range(len(csr_l0)):
-					csr_n.append(csr_names[i]==csr) 
-					csr_l.append(csr_l0[i] != csr_l1[i])
-				#print(instr_p, csr_n, csr_l, file=fdb)
-				if sum(csr_l)==1 and csr_l==csr_n: 
-					#Criteria 2 - Skiiping the scenario of writing to a CSR and changing only that CSR
-					skip = True
-			priv_trns = False
-			func_trns = False
-			#if (instr_t, comb_p, comb) not in comb_t:
-			#	comb_t.append((instr_t, comb_p, comb))
-			#	transitions.append(t)
-			if not skip:
-				# Privileged CSR transition check - only considered when FP_CSR is not set
-				if (not FP_CSR) and (instr_t, comb_pr_p, comb_pr) not in comb_priv and comb_pr_p!=comb_pr:
-					comb_priv.append((instr_t, comb_pr_p, comb_pr))
-					priv_trns = True
-					print("PRIVILEGE",instr_t,file=fdb)
-					print(comb_pr_p,file=fdb)
-					print(comb_pr,file=fdb)
-					j += 1
-
-				# FP CSR transition check
-				if (instr_t, comb_f_p, comb_f) not in comb_func and comb_f_p!=comb_f:
-					comb_func.append((instr_t, comb_f_p, comb_f))
-					func_trns = True
-					print("FLOAT",instr_t,file=fdb)
-					print(comb_f_p,file=fdb)
-					print(comb_f,file=fdb)
-					j += 1
-
-				if priv_trns or func_trns:
-					comb_t.append((instr_t, comb_p, comb))
-					transitions.append(t)
-
-			#j = j + 1
-		#	mstatus_p = mstatus
-		#	frm_p = frm
-		#	fflags_p = fflags
-		#	mcause_p = mcause
-		#	instr_p = instr
-	
-		mstatus_p = mstatus
-		frm_p = frm
-		fflags_p = fflags
-		mcause_p = mcause
-		scause_p = scause
-		medeleg_p = medeleg
-		mcounteren_p = mcounteren
-		scounteren_p = scounteren
-		#dcsr_p = dcsr
-		instr_p = instr
-		pc_p = pc
-		if ALL_CSR:
-			dcsr_p = dcsr
-			misa_p = misa
-			mhartid_p = mhartid
-			mip_p = mip
-			mie_p = mie
-			mideleg_p = mideleg
-			mepc_p = mepc
-			mtval_p = mtval
-			mtvec_p = mtvec
-			mscratch_p = mscratch
-			sstatus_p = sstatus
-			sip_p = sip
-			sie_p = sie
-			sepc_p = sepc
-			stval_p = stval
-			sscratch_p = sscratch
-			satp_p = satp
-			stvec_p = stvec
-			dpc_p = dpc
-			tselect_p = tselect
-			tdata1_p = tdata1
-			tdata2_p = tdata2
-			tdata3_p = tdata3
-			mcountinhibit_p = mcountinhibit
-			cycle_p = cycle
-			instret_p = instret
-			mhpmevent_p = mhpmevent
-			mhpmcounter_p = mhpmcounter
-			vstart_p = vstart
-			vxsat_p = vxsat
-			vxrm_p = vxrm
-			pmpcfg_p = pmpcfg
-			pmpaddr_p = pmpaddr
+	# Only records whose tracked CSR fields changed are looked at
+	for (n, prev, cur) in vector.changes(trace):
+		new = transition_store.observe(trace.instr[n-1], prev, cur, vector)
+		for (kind, instr_t, before, after) in new:
+			log.transition(it, kind, instr_t, vector.changed_fields(prev, cur, kind), before, after,
+			               vector.texts(trace.csrs[n-1], kind), vector.texts(trace.csrs[n], kind))
+			j += 1
 	
-	#j = 0
-	#print(duplic)
-	print("test ",it, file=fdb)
-	#for p,c in transitions:
-	#	#if not duplic[j]:
-	#	print("###########################",file=fdb)
-	#	print(p, file=fdb)
-	#	print(c, file=fdb)
-	#	j = j + 1
-	print("Number of transitions : ",j, file=fdb)
-	print("Instruction count     : ",count, file=fdb)
-	fdb.close()
+	# meta: what the caller knows of the test (template, seed)
+	log.test(it, j, count, **meta)
 	return j
-	#print(comb_t)
 
 def bp_timeout(proc):
     proc.kill
@@ -829,31 +664,32 @@ def save_err(out: str, proc_num: int, manager: procManager, stop_code: int, it):
                     out + '/err/err_{}_{}.si'.format(status, it))
 
 
-def isa_timeout(out, stop, proc_num, it):
+def isa_timeout(out, proc_num, it):
     if not os.path.isdir(out + '/isa_timeout'):
         os.makedirs(out + '/isa_timeout')
 
     #shutil.copy(out + '/tests/.input_{}.elf'.format(it), out + '/isa_timeout/timeout_{}.elf'.format(it))
     #shutil.copy(out + '/tests/.input_{}.S'.format(it), out + '/isa_timeout/timeout_{}.S'.format(it))
 
-    ps = psutil.Process()
-    children = ps.children(recursive=True)
-    for child in children:
-        try: os.kill(child.pid, signal.SIGKILL) # SIGKILL
-        except: continue
-
-    stop[0] = proc_state.ERR_ISA_TIMEOUT
-
-def run_isa_test(isaHost, isa_input, stop, out, proc_num, assert_intr=False, log='spike.log', name=''):
+def run_isa_test(isaHost, isa_input, stop, out, proc_num, assert_intr=False, name='',
+                 timeouts=None, template=None):
     ret = proc_state.NORMAL
-   
-    timer = Timer(ISA_TIME_LIMIT, isa_timeout, [out, stop, proc_num, name])
-    timer.start()
-    isa_ret = isaHost.run_test(isa_input, assert_intr, log)
-    timer.cancel()
-
-    if stop[0] == proc_state.ERR_ISA_TIMEOUT:
-        stop[0] = proc_state.NORMAL
+
+    # Per-template limit from IsaTimeouts if given, ISA_TIME_LIMIT otherwise
+    timeout = ISA_TIME_LIMIT
+    if timeouts is not None and template is not None:
+        timeout = timeouts.timeout(template)
+
+    # Spike runs in its own process group, only that job is killed on timeout
+    start = time.time()
+    (isa_ret, trace) = isaHost.run_test(isa_input, out, name, assert_intr, timeout=timeout)
+    # Cache hits are not Spike runs
+    cached = isa_ret == 0 and trace.cached
+    if timeouts is not None and template is not None and not cached and isa_ret in [0, TIME_OUT]:
+        timeouts.record(template, time.time() - start, isa_ret == TIME_OUT)
+
+    if isa_ret == TIME_OUT:
+        isa_timeout(out, proc_num, name)
         ret = proc_state.ERR_ISA_TIMEOUT
     elif isa_ret != 0:
         stop[0] = proc_state.ERR_ISA_ASSERT
@@ -884,12 +720,12 @@ def save_mismatch(base, proc_num, out, sim_input: simInput, data: list, num, it)
     shutil.copy(asm, out + '/asm/id_{}.S'.format(num))
     shutil.copy(hexfile, out + '/hex/id_{}.hex'.format(num))
 
-def setup(dut, toplevel, template, out, proc_num, debug, minimizing=False, no_guide=False):
+def setup(dut, toplevel, template, out, proc_num, debug, minimizing=False, no_guide=False, verify_layout=False):
     mutator = rvMutator(corpus_size=1000, no_guide=no_guide)
 
     cc = 'riscv64-unknown-elf-gcc'
     elf2hex = 'riscv64-unknown-elf-elf2hex'
-    preprocessor = rvPreProcessor(cc, elf2hex, template, out, proc_num)
+    preprocessor = rvPreProcessor(cc, elf2hex, template, out, proc_num, verify_layout)
 
     spike = os.environ['SPIKE']
     isa_sigfile = out + '/.isa_sig_{}.txt'.format(proc_num)
@@ -0,0 +1,2 @@
+# execution/test_executor.py is the TestExecutor module, not tests
+collect_ignore = ['execution/test_executor.py']
@@ -0,0 +1,149 @@
+""" CSR vector
+Declarative description of the CSR state transitions are tracked on. Each
+field names a column of the CSR bracket Spike prints, a mask of the bits
+that matter and the role of the field:
+
+  priv   privileged state, the PRIVILEGE view
+  func   floating-point state, the FLOAT view
+  other  only part of the whole-vector view
+
+A field's value is its masked bits shifted down, a mask of 0 drops the
+field. Which views decide novelty, whether CSR instructions are keyed with
+their CSR and whether criteria 2 applies are set per vector, the default,
+FP_CSR and ALL_CSR modes are the presets below. A field can be listed twice
+with different masks and roles, as mstatus is (whole and FS field).
+"""
+
+from collections import namedtuple
+
+PRIV = 'priv'
+FUNC = 'func'
+OTHER = 'other'
+ALL = 'all'
+
+FULL = (1 << 64) - 1
+MSTATUS_FS = 0x6000
+
+CsrField = namedtuple('CsrField', ['name', 'column', 'mask', 'role'])
+
+def shift(mask):
+    return (mask & -mask).bit_length() - 1 if mask else 0
+
+def pack(vals):
+    key = 0
+    for val in vals:
+        key = (key << 64) | val
+    return key
+
+
+class CsrVector():
+    def __init__(self, fields, views=(PRIV, FUNC), track_all=True, criteria2=True, csr_class=True):
+        self.fields = [ field for field in fields if field.mask ]
+        if not self.fields:
+            raise ValueError('CSR vector without fields, every mask is 0')
+        self.views = tuple(views)
+        self.track_all = track_all    # Record the whole vector of novel transitions
+        self.criteria2 = criteria2    # Skip a CSR write that only changes that CSR
+        self.csr_class = csr_class    # Key CSR instructions with their CSR
+        self.width = max(field.column for field in self.fields) + 1
+
+        self.shifts = [ shift(field.mask) for field in self.fields ]
+        members = { PRIV: [], FUNC: [], OTHER: [] }
+        for (i, field) in enumerate(self.fields):
+            members[field.role].append(i)
+        self.members = { PRIV: members[PRIV], FUNC: members[FUNC],
+                         ALL: list(range(len(self.fields))) }
+        # CSRs criteria 2 looks at, by name, narrowed by their mask or not
+        self.named = {}
+        for (i, field) in enumerate(self.fields):
+            self.named.setdefault(field.name, i)
+
+    def values(self, csrs):
+        """Field values of a record's CSR strings"""
+        return tuple((int(csrs[field.column], 16) & field.mask) >> s
+                     for (field, s) in zip(self.fields, self.shifts))
+
+    def changes(self, trace):
+        """Records of an IsaTrace whose field values differ from the previous record's
+
+        Returns (record, previous values, values) for each of them.
+        """
+        changed = []
+        last = (None, None)
+        for n in trace.changes(self.width):
+            prev = last[1] if last[0] == n - 1 else self.values(trace.csrs[n - 1])
+            cur = self.values(trace.csrs[n])
+            last = (n, cur)
+            if prev != cur:
+                changed.append((n, prev, cur))
+        return changed
+
+    def keys(self, vals):
+        """Packed key of every view"""
+        return { view: pack(vals[i] for i in members) for (view, members) in self.members.items() }
+
+    def texts(self, csrs, view):
+        """A view as transition.db prints it: whole CSRs as Spike printed them,
+        masked fields as decimal numbers"""
+        return ''.join(csrs[field.column] if field.mask == FULL else
+                       str((int(csrs[field.column], 16) & field.mask) >> shift(field.mask))
+                       for field in (self.fields[i] for i in self.members[view]))
+
+    def changed_fields(self, prev, cur, view):
+        """Names of the fields of a view that differ between two values"""
+        return [ self.fields[i].name for i in self.members[view] if prev[i] != cur[i] ]
+
+    def changed_names(self, prev, cur, names):
+        """Whether each named CSR changed, False for CSRs not in the vector"""
+        return [ name in self.named and prev[self.named[name]] != cur[self.named[name]]
+                 for name in names ]
+
+
+DEFAULT_FIELDS = [
+    CsrField('mstatus',     0, FULL,       PRIV),
+    CsrField('mstatus.fs',  0, MSTATUS_FS, FUNC),
+    CsrField('frm',         1, FULL,       FUNC),
+    CsrField('fflags',      2, FULL,       FUNC),
+    CsrField('mcause',      3, FULL,       PRIV),
+    CsrField('scause',      4, FULL,       PRIV),
+    CsrField('medeleg',     5, FULL,       PRIV),
+    CsrField('mcounteren',  6, FULL,       PRIV),
+    CsrField('scounteren',  7, FULL,       PRIV),
+]
+
+# Columns of Spike's bracket with all CSRs logged
+ALL_CSR_NAMES = ['mstatus', 'frm', 'fflags', 'mcause', 'scause', 'medeleg', 'mcounteren',
+                 'scounteren', 'dcsr', 'misa', 'mhartid', 'mip', 'mie', 'mideleg', 'mepc',
+                 'mtval', 'mtvec', 'mscratch', 'sstatus', 'sip', 'sie', 'sepc', 'stval',
+                 'sscratch', 'satp', 'stvec', 'dpc', 'tselect', 'tdata1', 'tdata2', 'tdata3',
+                 'mcountinhibit', 'cycle', 'instret', 'mhpmevent', 'mhpmcounter', 'vstart',
+                 'vxsat', 'vxrm', 'pmpcfg', 'pmpaddr']
+
+ALL_FIELDS = [ CsrField(name, column, FULL, OTHER) for (column, name) in enumerate(ALL_CSR_NAMES) ]
+
+DEFAULT = CsrVector(DEFAULT_FIELDS)
+FP_ONLY = CsrVector(DEFAULT_FIELDS, views=(FUNC,))
+ALL_CSR = CsrVector(ALL_FIELDS, views=(ALL,), track_all=False, criteria2=False, csr_class=False)
+
+def preset(all_csr=False, fp_csr=False):
+    """Vector of the ALL_CSR / FP_CSR modes"""
+    if all_csr:
+        return ALL_CSR
+    return FP_ONLY if fp_csr else DEFAULT
+
+def masked(vector, masks):
+    """Copy of a vector with the bits of the named CSRs narrowed, masks maps
+    CSR names to the bits to keep, 0 drops the CSR (e.g. cycle, instret)"""
+    fields = [ field._replace(mask=field.mask & masks[field.name]) if field.name in masks else field
+               for field in vector.fields ]
+    return CsrVector(fields, vector.views, vector.track_all, vector.criteria2, vector.csr_class)
+
+def parse_masks(spec):
+    """Masks of a spec as 'cycle,instret,mstatus=0x1888', a bare name drops the CSR"""
+    masks = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        (name, _, mask) = item.partition('=')
+        masks[name.strip()] = int(mask, 0) if mask else 0
+    return masks
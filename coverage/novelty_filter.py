@@ -0,0 +1,182 @@
+""" Novelty filter
+Node-wide Bloom filter of the transition fingerprints in the shared
+transition table, checked before the table. A key the filter has never seen
+is new to the filter and goes straight to the table insert. A key the filter
+holds is confirmed by a lock-free lookup in the table before it is taken as
+known, a key the table does not hold is a false positive: it is counted and
+goes on to the insert, no transition is lost to the filter.
+
+The filter is a file mmap'd by every worker, bits are read and set without
+locks. A bit lost to a racing write only makes a known key look new, and the
+table answers that correctly. When the estimated false-positive rate passes
+`target` (or the measured one does), a worker rebuilds the filter from the
+table at twice the size into a new file, renames it over the old one and
+marks the old one stale. The other workers see the mark on their next query
+and remap the new file.
+"""
+
+import os
+import math
+import mmap
+import fcntl
+import struct
+
+MAGIC = b'PFBLOOM1'
+STALE = b'PFBLOOMX'
+# magic, bits, hashes, keys added (approximate, updated without locks)
+HEADER = struct.Struct('<8sQQQ')
+KEYS = struct.Struct('<Q')
+KEYS_OFFSET = 24
+
+def hashes_for(bits, keys):
+    """Hash count giving the lowest false-positive rate for keys in bits"""
+    return max(1, min(16, int(round(bits / max(keys, 1) * math.log(2)))))
+
+
+class NoveltyFilter():
+    def __init__(self, path, bits=1 << 27, hashes=7, target=0.01, max_bits=1 << 33):
+        self.path = path
+        self.target = target
+        self.max_bits = max_bits
+        self.mm = None
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX, HEADER.size, 0)
+            try:
+                if os.fstat(fd).st_size < HEADER.size:
+                    os.ftruncate(fd, HEADER.size + (bits + 7) // 8)
+                    os.pwrite(fd, HEADER.pack(MAGIC, bits, hashes, 0), 0)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, HEADER.size, 0)
+        finally:
+            os.close(fd)
+        self._map()
+
+        self.calls = 0
+        self.stats = { 'queries': 0, 'negatives': 0, 'positives': 0,
+                       'false_positives': 0, 'rebuilds': 0 }
+
+    def _map(self):
+        if self.mm is not None:
+            self.mm.close()
+        with open(self.path, 'r+b') as fd:
+            self.ino = os.fstat(fd.fileno()).st_ino
+            self.mm = mmap.mmap(fd.fileno(), 0)
+        (magic, self.bits, self.hashes, _) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a novelty filter'.format(self.path))
+
+    def _positions(self, key):
+        h1 = key & 0xffffffff
+        h2 = (key >> 32) | 1
+        return [ (h1 + i * h2) % self.bits for i in range(self.hashes) ]
+
+    def _tick(self):
+        self.calls += 1
+        if self.mm[:len(STALE)] == STALE:
+            # Rebuilt by another worker
+            self._map()
+
+    def contains(self, key):
+        mm = self.mm
+        for pos in self._positions(key):
+            if not mm[HEADER.size + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def known(self, key, verify):
+        """True if the filter holds key and verify(key) (the table) confirms it"""
+        self._tick()
+        self.stats['queries'] += 1
+        if not self.contains(key):
+            self.stats['negatives'] += 1
+            return False
+        self.stats['positives'] += 1
+        if not verify(key):
+            self.stats['false_positives'] += 1
+            return False
+        return True
+
+    def add(self, key):
+        mm = self.mm
+        for pos in self._positions(key):
+            i = HEADER.size + (pos >> 3)
+            mm[i] = mm[i] | (1 << (pos & 7))
+        keys = KEYS.unpack_from(mm, KEYS_OFFSET)[0]
+        KEYS.pack_into(mm, KEYS_OFFSET, keys + 1)
+
+    def estimated_fp(self):
+        """False-positive rate expected from the keys added and the size"""
+        keys = KEYS.unpack_from(self.mm, KEYS_OFFSET)[0]
+        return (1.0 - math.exp(-self.hashes * keys / self.bits)) ** self.hashes
+
+    def measured_fp(self):
+        """False positives among the positives, None before any positive"""
+        if not self.stats['positives']:
+            return None
+        return self.stats['false_positives'] / self.stats['positives']
+
+    def maybe_rebuild(self, source):
+        """Rebuild from source() (fingerprints of the table) once the filter is too full,
+        by the estimate or by the measured false positives"""
+        if self.bits >= self.max_bits:
+            return False
+        measured = self.measured_fp() if self.stats['positives'] >= 256 else None
+        if self.estimated_fp() <= self.target and (measured is None or measured <= self.target):
+            return False
+        return self.rebuild(source)
+
+    def rebuild(self, source, bits=None):
+        """Build a filter of source() at twice the size (or bits), swap it in"""
+        lock = open(self.path + '.lock', 'w')
+        try:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Another worker is rebuilding it
+                return False
+            if self.mm[:len(STALE)] == STALE or os.stat(self.path).st_ino != self.ino:
+                self._map()
+                return False
+            keys = list(source())
+            bits = bits or min(self.bits * 2, self.max_bits)
+            # Sized for twice the keys there are now
+            hashes = hashes_for(bits, len(keys) * 2)
+            tmp = self.path + '.new'
+            with open(tmp, 'wb') as fd:
+                fd.truncate(HEADER.size + (bits + 7) // 8)
+            with open(tmp, 'r+b') as fd:
+                mm = mmap.mmap(fd.fileno(), 0)
+                HEADER.pack_into(mm, 0, MAGIC, bits, hashes, len(keys))
+                for key in keys:
+                    h1 = key & 0xffffffff
+                    h2 = (key >> 32) | 1
+                    for i in range(hashes):
+                        pos = (h1 + i * h2) % bits
+                        j = HEADER.size + (pos >> 3)
+                        mm[j] = mm[j] | (1 << (pos & 7))
+                mm.close()
+            os.replace(tmp, self.path)
+            self.mm[:len(STALE)] = STALE
+            self._map()
+            self.stats['rebuilds'] += 1
+            # Positives of the old filter say nothing of this one
+            self.stats['positives'] = self.stats['false_positives'] = 0
+            print('[ProcessorFuzz] Novelty filter rebuilt: {} keys, {} bits, {} hashes'.format(
+                len(keys), bits, hashes))
+            return True
+        finally:
+            lock.close()
+
+    def report(self):
+        measured = self.measured_fp()
+        return '[ProcessorFuzz] Novelty filter: {} queries, {} negatives, {} positives, ' \
+               '{}/{} false positives ({}), estimated {:.4f}, {} rebuilds'.format(
+                   self.stats['queries'], self.stats['negatives'], self.stats['positives'],
+                   self.stats['false_positives'], self.stats['positives'],
+                   'n/a' if measured is None else '{:.4f}'.format(measured),
+                   self.estimated_fp(), self.stats['rebuilds'])
+
+    def close(self):
+        self.mm.close()
@@ -0,0 +1,253 @@
+""" Shared transition store
+TransitionStore whose seen sets live in one table shared by every worker on
+the node, so a transition found by one worker (or by an earlier batch or
+campaign run) is not new to the others. The table is an open-addressing hash
+table of 64-bit fingerprints of (view, instruction, before, after) in a file
+mmap'd by all workers, on a RAM-backed filesystem. Lookups read it without
+locks, inserts take an fcntl lock on the stripe of the slot they write and
+re-check it. The header counts the slots in use, the table takes no more
+keys past `max_load` of its capacity so probe runs stay short and a lookup
+always ends on an empty slot.
+
+save() copies the table to the output directory, a later run with the same
+output directory starts from that copy. Every worker holds a shared flock on
+`<table>.users` while it has the table open. The first worker in, finding no
+other user, drops whatever table and filter an earlier (or crashed) campaign
+left in /dev/shm and loads the saved copy only. The last worker out saves the
+table and unlinks it, so nothing but the saved copy outlives the campaign.
+
+A lookup racing an insert of the same key can miss it, the transition is
+then counted new twice: once per worker, never more.
+
+Keys are checked in a node-wide Bloom filter (novelty_filter) first. A key
+the filter holds is confirmed by a lock-free lookup before it is taken as
+known, only keys the filter has not seen (or wrongly holds) are inserted.
+"""
+
+import os
+import mmap
+import fcntl
+import shutil
+import struct
+import hashlib
+import tempfile
+
+from coverage.transition_store import TransitionStore, PRIV, FUNC
+from coverage.novelty_filter import NoveltyFilter
+
+MAGIC = b'PFTRNS03'
+# magic, capacity (slots), stripe size (slots), slots used
+HEADER = struct.Struct('<8sQQQ')
+SLOT = struct.Struct('<Q')
+USED = struct.Struct('<Q')
+USED_OFFSET = 24
+
+def default_table_path(out_dir):
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    name = hashlib.sha1(os.path.abspath(out_dir).encode()).hexdigest()[:12]
+    return os.path.join(base, 'processorfuzz_transitions_{}.tbl'.format(name))
+
+def fingerprint(kind, instr_t, before, after):
+    digest = hashlib.blake2b('{}\0{}\0{}\0{}'.format(kind, instr_t, before, after).encode(),
+                             digest_size=8)
+    # 0 marks an empty slot
+    return int.from_bytes(digest.digest(), 'little') or 1
+
+
+class SharedTransitionStore(TransitionStore):
+    def __init__(self, out_dir, capacity=1 << 22, stripe=1 << 12, table_path=None,
+                 filter_bits=1 << 27, filter_rebuild_every=1 << 12, max_load=0.75):
+        super().__init__()
+        self.saved_path = os.path.join(out_dir, 'transitions.tbl')
+        self.path = table_path or default_table_path(out_dir)
+        self.full = False
+
+        # Opening and closing are serialized on the users file
+        self.users = open(self.path + '.users', 'a')
+        fcntl.lockf(self.users, fcntl.LOCK_EX)
+        try:
+            if self._alone():
+                # Left by an earlier campaign, only the saved copy carries over
+                self._unlink()
+            fcntl.flock(self.users, fcntl.LOCK_SH)
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            # First worker in sets the table up, from the saved one if any
+            if os.fstat(self.fd).st_size < HEADER.size:
+                self._create(capacity, stripe)
+        finally:
+            fcntl.lockf(self.users, fcntl.LOCK_UN)
+
+        self.mm = mmap.mmap(self.fd, 0)
+        (magic, self.capacity, self.stripe, _) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a transition table'.format(self.path))
+        self.max_used = int(self.capacity * max_load)
+
+        self.local = { kind: 0 for kind in self.seen }
+
+        # filter_bits=0 turns the filter off
+        self.filter = NoveltyFilter(self.path + '.bloom', filter_bits) if filter_bits else None
+        self.rebuild_every = filter_rebuild_every
+
+    def _alone(self):
+        """True if no other worker has the table open"""
+        try:
+            fcntl.flock(self.users, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def _unlink(self):
+        for path in [ self.path, self.path + '.bloom' ]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _create(self, capacity, stripe):
+        if os.path.isfile(self.saved_path):
+            with open(self.saved_path, 'rb') as src:
+                if src.read(len(MAGIC)) == MAGIC:
+                    src.seek(0)
+                    with os.fdopen(os.dup(self.fd), 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+                    print('[ProcessorFuzz] Transition table loaded from {}'.format(self.saved_path))
+                    return
+        os.ftruncate(self.fd, HEADER.size + capacity * SLOT.size)
+        os.pwrite(self.fd, HEADER.pack(MAGIC, capacity, stripe, 0), 0)
+
+    def _offset(self, slot):
+        return HEADER.size + slot * SLOT.size
+
+    def _find(self, key):
+        """(slot, found) of a fingerprint: its slot, or the first empty one"""
+        slot = key % self.capacity
+        for _ in range(self.capacity):
+            value = SLOT.unpack_from(self.mm, self._offset(slot))[0]
+            if value == key:
+                return (slot, True)
+            if value == 0:
+                return (slot, False)
+            slot = (slot + 1) % self.capacity
+        return (None, False)
+
+    def _is_full(self):
+        if not self.full and USED.unpack_from(self.mm, USED_OFFSET)[0] >= self.max_used:
+            print('[ProcessorFuzz] Transition table {} is full'.format(self.path))
+            self.full = True
+        return self.full
+
+    def _claim(self):
+        """Count one more slot in use, False if the table is at its load limit"""
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, USED.size, USED_OFFSET)
+        try:
+            used = USED.unpack_from(self.mm, USED_OFFSET)[0]
+            if used >= self.max_used:
+                return False
+            USED.pack_into(self.mm, USED_OFFSET, used + 1)
+            return True
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, USED.size, USED_OFFSET)
+
+    def _insert(self, key):
+        """True if the fingerprint was not in the table and is now, None once it is full"""
+        while True:
+            if self._is_full():
+                return False if self._contains(key) else None
+            (slot, found) = self._find(key)
+            if found:
+                return False
+            start = self._offset(slot - slot % self.stripe)
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, self.stripe * SLOT.size, start)
+            try:
+                value = SLOT.unpack_from(self.mm, self._offset(slot))[0]
+                if value == 0:
+                    if not self._claim():
+                        continue
+                    SLOT.pack_into(self.mm, self._offset(slot), key)
+                    return True
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, self.stripe * SLOT.size, start)
+            # Taken by another worker meanwhile, look again
+
+    def _contains(self, key):
+        return self._find(key)[1]
+
+    def _fingerprints(self):
+        for slot in range(self.capacity):
+            value = SLOT.unpack_from(self.mm, self._offset(slot))[0]
+            if value:
+                yield value
+
+    def _known(self, key):
+        """True if the filter holds the key and the table confirms it, rebuilds the filter now and then"""
+        if self.filter is None:
+            return False
+        known = self.filter.known(key, self._contains)
+        if self.filter.calls % self.rebuild_every == 0:
+            self.filter.maybe_rebuild(self._fingerprints)
+        return known
+
+    def is_new(self, kind, instr_t, before, after):
+        if before == after:
+            return False
+        key = fingerprint(kind, instr_t, before, after)
+        return not self._known(key) and not self._contains(key)
+
+    def add(self, kind, instr_t, before, after):
+        key = fingerprint(kind, instr_t, before, after)
+        if self._known(key):
+            return False
+        inserted = self._insert(key)
+        if inserted is None:
+            # Table full, novelty is only tracked by this worker from here
+            return TransitionStore.add(self, kind, instr_t, before, after)
+        if inserted:
+            self.local[kind] += 1
+        if self.filter is not None:
+            self.filter.add(key)
+        return inserted
+
+    def count(self, kind=None):
+        """Transitions this worker added, of one view or of priv and func"""
+        if kind is None:
+            return self.local[PRIV] + self.local[FUNC] + \
+                   len(self.seen[PRIV]) + len(self.seen[FUNC])
+        return self.local[kind] + len(self.seen[kind])
+
+    def snapshot(self):
+        """Fingerprints in the table"""
+        return set(self._fingerprints())
+
+    def size(self):
+        """Fingerprints in the table, of every worker"""
+        return len(self.snapshot())
+
+    def save(self):
+        """Copy the table to the output directory, atomically"""
+        os.makedirs(os.path.dirname(self.saved_path), exist_ok=True)
+        tmp = self.saved_path + '.tmp'
+        with open(tmp, 'wb') as fd:
+            fd.write(self.mm[:])
+        os.replace(tmp, self.saved_path)
+        return self.saved_path
+
+    def report(self):
+        """Lines on the novelty filter, empty without one"""
+        return [ self.filter.report() ] if self.filter is not None else []
+
+    def close(self):
+        """Close the table, the last worker out saves and unlinks it"""
+        fcntl.lockf(self.users, fcntl.LOCK_EX)
+        try:
+            if self._alone():
+                self.save()
+                self._unlink()
+            if self.filter is not None:
+                self.filter.close()
+            self.mm.close()
+            os.close(self.fd)
+            fcntl.flock(self.users, fcntl.LOCK_UN)
+        finally:
+            fcntl.lockf(self.users, fcntl.LOCK_UN)
+            self.users.close()
@@ -0,0 +1,44 @@
+""" NoveltyFilter: confirmed positives and rebuilds seen by every worker
+"""
+from coverage.novelty_filter import NoveltyFilter
+
+KEYS = [ (i * 0x9e3779b97f4a7c15) & ((1 << 64) - 1) for i in range(1, 2001) ]
+
+def test_positives_are_confirmed(tmp_path):
+    bloom = NoveltyFilter(str(tmp_path / 'f.bloom'), bits=1 << 12)
+    try:
+        table = set()
+        for key in KEYS[:100]:
+            bloom.add(key)
+            table.add(key)
+        assert all(bloom.known(key, table.__contains__) for key in KEYS[:100])
+        # Held by the filter, not by the table: counted, not taken as known
+        assert not bloom.known(KEYS[0], lambda key: False)
+        assert bloom.stats['false_positives'] == 1
+        assert bloom.measured_fp() == 1 / 101
+    finally:
+        bloom.close()
+
+def test_rebuild_reaches_other_workers(tmp_path):
+    path = str(tmp_path / 'f.bloom')
+    first = NoveltyFilter(path, bits=1 << 10, hashes=4)
+    second = NoveltyFilter(path, bits=1 << 10, hashes=4)
+    try:
+        for key in KEYS:
+            first.add(key)
+        before = first.estimated_fp()
+        assert before > first.target
+        assert first.maybe_rebuild(lambda: iter(KEYS))
+        assert first.bits == 1 << 11
+        assert first.stats['rebuilds'] == 1
+        assert all(first.contains(key) for key in KEYS)
+        assert first.estimated_fp() < before
+
+        # The other worker remaps on its next query
+        assert second.bits == 1 << 10
+        assert all(second.known(key, lambda key: True) for key in KEYS)
+        assert second.bits == 1 << 11
+        assert second.hashes == first.hashes
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,68 @@
+""" Transition log: segments read back, and rendered as the transition.db text
+"""
+import io
+
+from common.compression import close_shared_writers
+from coverage.transition_log import TransitionLog, read_log, segments, to_db
+from coverage.transition_report import read_db
+
+DB = """PRIVILEGE csrw mstatus
+0000000a00000000000000000000000000000000000000000000000000000000000000000000000000000000
+0000000a00000008000000000000000000000000000000000000000000000000000000000000000000000000
+FLOAT csrw mstatus
+000
+300
+test  0
+Number of transitions :  2
+Instruction count     :  120
+FLOAT fadd.s
+300
+301
+test  1
+Number of transitions :  1
+Instruction count     :  88
+test  2
+Number of transitions :  0
+Instruction count     :  64
+"""
+
+def render(records):
+    fd = io.StringIO()
+    to_db(records, fd)
+    return fd.getvalue()
+
+def test_db_round_trip(tmp_path):
+    db = tmp_path / 'transition.db'
+    db.write_text(DB)
+    assert render(read_db(str(db))) == DB
+
+def test_log_round_trip(tmp_path, monkeypatch):
+    monkeypatch.delenv('PROCESSORFUZZ_COMPRESS', raising=False)
+    db = tmp_path / 'transition.db'
+    db.write_text(DB)
+    out = str(tmp_path / 'out')
+
+    # Tests 0 and 1 on one worker, test 2 on another, after it
+    for (worker, its) in [('w0', [0, 1]), ('w1', [2])]:
+        log = TransitionLog(out, worker=worker, flush_every=2)
+        for record in read_db(str(db)):
+            if record['it'] not in its:
+                continue
+            if record['type'] == 'trn':
+                log.transition(record['it'], record['kind'], record['instr'], ['mstatus'],
+                               0xa00000000, 0xa00000008, record['before_text'], record['after_text'])
+            else:
+                log.test(record['it'], record['transitions'], record['instructions'],
+                         template='p-m', seed=7)
+        log.close()
+    close_shared_writers()
+
+    assert [ path.rsplit('/', 1)[1] for path in segments(out) ] == ['w0.jsonl', 'w1.jsonl']
+    records = list(read_log(out))
+    assert render(records) == DB
+    assert [ record['worker'] for record in records if record['type'] == 'test' ] == ['w0', 'w0', 'w1']
+    trn = records[0]
+    assert (trn['kind'], trn['csrs'], trn['before'], trn['after']) == \
+           ('priv', ['mstatus'], 'a00000000', 'a00000008')
+    assert all(record['template'] == 'p-m' and record['seed'] == 7
+               for record in records if record['type'] == 'test')
@@ -0,0 +1,160 @@
+""" TransitionStore and SharedTransitionStore against the lists
+extract_transitions scanned before them (original/Fuzzer/src/utils.py)
+"""
+import random
+
+import pytest
+
+from coverage.csr_vector import ALL, PRIV, FUNC, DEFAULT, FP_ONLY, ALL_CSR, ALL_CSR_NAMES
+from coverage.transition_store import TransitionStore
+from coverage.shared_transition_store import SharedTransitionStore
+
+INSTRS = ['add a0, a1, a2', 'fadd.s fa0, fa1, fa2', 'ecall', 'mret', 'sret',
+          'csrw mstatus, a0', 'csrw sstatus, a0', 'csrwi fflags, 1', 'csrrs a0, fflags, a1',
+          'csrrw a0, mcause, a1', 'csrrwi a0, frm, 2', 'csrs mcause, a0']
+
+def old_transitions(steps, all_csr, fp_csr):
+    """Kinds new at each step, by the list semantics of the old extract_transitions"""
+    csr_names = ['mstatus', 'mcause', 'scause', 'fflags']
+    comb_t = []
+    comb_priv = []
+    comb_func = []
+    found = []
+    for (instr_p, p, c) in steps:
+        new = []
+        if all_csr:
+            instr_t = instr_p.split()[0].strip()
+            if p != c and (instr_t, ''.join(p), ''.join(c)) not in comb_t:
+                comb_t.append((instr_t, ''.join(p), ''.join(c)))
+                new.append((ALL, instr_t, None, None))
+            found.append(new)
+            continue
+        if p[:8] == c[:8]:
+            found.append(new)
+            continue
+        comb_pr = c[0] + c[3] + c[4] + c[5] + c[6] + c[7]
+        comb_pr_p = p[0] + p[3] + p[4] + p[5] + p[6] + p[7]
+        comb_f = str((int(c[0], 16) >> 13) & 3) + c[1] + c[2]
+        comb_f_p = str((int(p[0], 16) >> 13) & 3) + p[1] + p[2]
+        instr_t = instr_p.split()[0].strip()
+        csr = ''
+        if 'csrr' in instr_p:
+            instr_t += ' ' + instr_p.split(',')[1].strip()
+            csr = instr_p.split(',')[1].strip()
+        elif instr_t in ['csrw', 'csrs', 'csrc', 'csrwi', 'csrsi', 'csrci']:
+            instr_t = ' '.join(instr_p.split(',')[0].split())
+            csr = instr_p.split(',')[0].split()[1]
+        if csr == 'sstatus': csr = 'mstatus'
+        if csr in csr_names:
+            csr_n = [ name == csr for name in csr_names ]
+            csr_l = [ c[i] != p[i] for i in [0, 3, 4, 2] ]
+            if sum(csr_l) == 1 and csr_l == csr_n:
+                found.append(new)
+                continue
+        if not fp_csr and comb_pr_p != comb_pr and (instr_t, comb_pr_p, comb_pr) not in comb_priv:
+            comb_priv.append((instr_t, comb_pr_p, comb_pr))
+            new.append((PRIV, instr_t, comb_pr_p, comb_pr))
+        if comb_f_p != comb_f and (instr_t, comb_f_p, comb_f) not in comb_func:
+            comb_func.append((instr_t, comb_f_p, comb_f))
+            new.append((FUNC, instr_t, comb_f_p, comb_f))
+        found.append(new)
+    return found
+
+def random_steps(n, columns, seed):
+    """(instruction, CSRs before, CSRs after) of a random trace, few distinct values
+    so transitions repeat, often changing a single CSR"""
+    rng = random.Random(seed)
+    pools = [ ['{:016x}'.format(v) for v in [0xa00000000, 0xa00006000, 0xa00002080, 0x8000000a00000800]],
+              ['0', '2'], ['00', '01', '10'] ] + \
+            [ ['{:016x}'.format(v) for v in [0, 2, 8, 0xb]] ] * (columns - 3)
+    cur = [ pool[0] for pool in pools ]
+    steps = []
+    for _ in range(n):
+        prev = list(cur)
+        for column in rng.sample(range(columns), rng.choice([0, 1, 1, 2, 3])):
+            cur[column] = rng.choice(pools[column])
+        steps.append((rng.choice(INSTRS), prev, list(cur)))
+    return steps
+
+def observed(store, steps, vector):
+    found = []
+    for (instr, p, c) in steps:
+        new = store.observe(instr, vector.values(p), vector.values(c), vector)
+        found.append([ (kind, instr_t, vector.texts(p, kind), vector.texts(c, kind))
+                       for (kind, instr_t, _, _) in new ])
+    return found
+
+@pytest.mark.parametrize('fp_csr', [False, True])
+def test_observe_matches_old_lists(fp_csr):
+    steps = random_steps(3000, 8, seed=1)
+    vector = FP_ONLY if fp_csr else DEFAULT
+    old = old_transitions(steps, False, fp_csr)
+    assert observed(TransitionStore(), steps, vector) == old
+    # Criteria 2 and both views came up
+    kinds = { kind for new in old for (kind, _, _, _) in new }
+    assert kinds == ({FUNC} if fp_csr else {PRIV, FUNC})
+
+def test_observe_all_csr_matches_old_lists():
+    steps = random_steps(3000, len(ALL_CSR_NAMES), seed=2)
+    old = old_transitions(steps, True, False)
+    new = [ [ (kind, instr_t, None, None) for (kind, instr_t, _, _) in step ]
+            for step in observed(TransitionStore(), steps, ALL_CSR) ]
+    assert new == old
+    assert any(old)
+
+def test_criteria2_skips_a_write_changing_only_its_csr():
+    p = ['{:016x}'.format(0xa00000000), '0', '00'] + ['{:016x}'.format(0)] * 5
+    c = list(p)
+    c[2] = '01'
+    store = TransitionStore()
+    assert store.observe('csrwi fflags, 1', DEFAULT.values(p), DEFAULT.values(c)) == []
+    assert [ kind for (kind, _, _, _) in
+             store.observe('fadd.s fa0, fa1, fa2', DEFAULT.values(p), DEFAULT.values(c)) ] == [FUNC]
+
+def test_shared_store_matches_local_store(tmp_path):
+    steps = random_steps(2000, 8, seed=3)
+    shared = SharedTransitionStore(str(tmp_path), capacity=1 << 12,
+                                   table_path=str(tmp_path / 'table.tbl'), filter_bits=1 << 14)
+    try:
+        assert observed(shared, steps, DEFAULT) == observed(TransitionStore(), steps, DEFAULT)
+    finally:
+        shared.close()
+
+def test_shared_store_insert_and_reload(tmp_path):
+    out = str(tmp_path)
+    table = str(tmp_path / 'table.tbl')
+    first = SharedTransitionStore(out, capacity=1 << 10, table_path=table, filter_bits=1 << 12)
+    second = SharedTransitionStore(out, capacity=1 << 10, table_path=table, filter_bits=1 << 12)
+    assert first.add(PRIV, 'add', 1, 2)
+    assert not second.add(PRIV, 'add', 1, 2)
+    assert second.add(FUNC, 'add', 1, 2)
+    assert first.size() == second.size() == 2
+    first.close()
+    # The last worker out saves the table and drops it
+    second.close()
+    assert not (tmp_path / 'table.tbl').exists()
+    assert (tmp_path / 'transitions.tbl').exists()
+
+    reloaded = SharedTransitionStore(out, capacity=1 << 10, table_path=table, filter_bits=1 << 12)
+    try:
+        assert reloaded.size() == 2
+        assert not reloaded.add(PRIV, 'add', 1, 2)
+        assert not reloaded.is_new(FUNC, 'add', 1, 2)
+        assert reloaded.is_new(ALL, 'add', 1, 2)
+    finally:
+        reloaded.close()
+
+def test_shared_store_stops_at_its_load_limit(tmp_path):
+    store = SharedTransitionStore(str(tmp_path), capacity=64, table_path=str(tmp_path / 'table.tbl'),
+                                  filter_bits=0, max_load=0.75)
+    try:
+        added = [ store.add(PRIV, 'add', i, i + 1) for i in range(100) ]
+        # Past the limit novelty is tracked by this worker alone, nothing is lost
+        assert all(added)
+        assert store.full
+        assert store.size() == 48
+        assert store.count(PRIV) == 100
+        assert not store.add(PRIV, 'add', 0, 1)
+        assert not store.add(PRIV, 'add', 99, 100)
+    finally:
+        store.close()
@@ -0,0 +1,181 @@
+""" Transition log
+Structured record of the transitions a campaign finds, in place of the text
+appended to transition.db by every worker. Each worker writes its own
+segment, <out>/transitions/<worker>.jsonl (compressed as record_path says),
+one JSON object per line:
+
+  {"type": "trn", "worker", "it", "time", "kind", "instr", "csrs",
+   "before", "after", "before_text", "after_text"}
+  {"type": "test", "worker", "it", "time", "transitions", "instructions", ...}
+
+kind is the CSR vector view (priv, func, all), instr the instruction key,
+csrs the CSRs of the view that changed, before/after the packed view keys
+in hex and *_text the view as transition.db printed it. Test records carry
+whatever the caller knows about the test (template, seed). Records are
+buffered and handed to the segment's background writer with each test
+record, so the log never ends in the middle of a test, or flush_every at a
+time within a test.
+
+python -m coverage.transition_log {merge,db,query} <out> merges the
+segments in time order, renders the old transition.db text or filters
+records.
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import atexit
+import socket
+import argparse
+import threading
+
+from common.compression import open_trace, record_path, shared_writer
+
+def default_worker():
+    return '{}-{}'.format(socket.gethostname(), os.getpid())
+
+def segments(out_dir):
+    """Segment files of a campaign"""
+    seg_dir = os.path.join(out_dir, 'transitions')
+    if not os.path.isdir(seg_dir):
+        return []
+    return sorted(os.path.join(seg_dir, name) for name in os.listdir(seg_dir)
+                  if '.jsonl' in name)
+
+def read_segment(path):
+    with open_trace(path) as fd:
+        for line in fd:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def read_log(out_dir):
+    """Records of every segment, merged in time order"""
+    return heapq.merge(*(read_segment(path) for path in segments(out_dir)),
+                       key=lambda record: record['time'])
+
+
+class TransitionLog():
+    def __init__(self, out_dir, worker=None, flush_every=512):
+        self.worker = worker or default_worker()
+        seg_dir = os.path.join(out_dir, 'transitions')
+        os.makedirs(seg_dir, exist_ok=True)
+        self.path = record_path(os.path.join(seg_dir, '{}.jsonl'.format(self.worker)))
+        self.flush_every = flush_every
+
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.fd = None
+
+    def _append(self, record, flush=False):
+        record['worker'] = self.worker
+        record['time'] = time.time()
+        with self.lock:
+            self.buffer.append(json.dumps(record, separators=(',', ':')))
+            if flush or len(self.buffer) >= self.flush_every:
+                self._flush()
+
+    def transition(self, it, kind, instr, csrs, before, after, before_text, after_text):
+        self._append({ 'type': 'trn', 'it': it, 'kind': kind, 'instr': instr, 'csrs': csrs,
+                       'before': '{:x}'.format(before), 'after': '{:x}'.format(after),
+                       'before_text': before_text, 'after_text': after_text })
+
+    def test(self, it, transitions, instructions, **meta):
+        record = { 'type': 'test', 'it': it, 'transitions': transitions,
+                   'instructions': instructions }
+        record.update(meta)
+        # Ends the records of the test
+        self._append(record, flush=True)
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        if self.fd is None:
+            self.fd = shared_writer(self.path)
+        self.fd.write('\n'.join(self.buffer) + '\n')
+        self.buffer = []
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    close = flush
+
+
+# Logs of this worker, by output directory
+logs = {}
+
+def transition_log(out_dir):
+    log = logs.get(out_dir)
+    if log is None:
+        log = logs[out_dir] = TransitionLog(out_dir)
+    return log
+
+def close_logs():
+    for log in logs.values():
+        log.close()
+
+# Registered after the shared writers, so it runs before they are closed
+atexit.register(close_logs)
+
+
+LABELS = { 'priv': 'PRIVILEGE', 'func': 'FLOAT' }
+
+def to_db(records, fd):
+    """Write records as the transition.db text"""
+    for record in records:
+        if record['type'] == 'trn':
+            if record['kind'] in LABELS:
+                print(LABELS[record['kind']], record['instr'], file=fd)
+                print(record['before_text'], file=fd)
+                print(record['after_text'], file=fd)
+        elif record['type'] == 'test':
+            print("test ", record['it'], file=fd)
+            print("Number of transitions : ", record['transitions'], file=fd)
+            print("Instruction count     : ", record['instructions'], file=fd)
+
+def matches(record, args):
+    return ((args.type is None or record['type'] == args.type) and
+            (args.kind is None or record.get('kind') == args.kind) and
+            (args.instr is None or record.get('instr') == args.instr) and
+            (args.worker is None or record['worker'] == args.worker) and
+            (args.first is None or record['it'] >= args.first) and
+            (args.last is None or record['it'] <= args.last))
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge and query transition log segments')
+    parser.add_argument('command', choices=['merge', 'db', 'query'])
+    parser.add_argument('out', type=str, help='Campaign output directory')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='Output file, stdout by default')
+    parser.add_argument('--type', type=str, default=None, help='trn or test')
+    parser.add_argument('--kind', type=str, default=None, help='priv, func or all')
+    parser.add_argument('--instr', type=str, default=None, help='Instruction key')
+    parser.add_argument('--worker', type=str, default=None)
+    parser.add_argument('--first', type=int, default=None, help='First iteration')
+    parser.add_argument('--last', type=int, default=None, help='Last iteration')
+    parser.add_argument('--count', action='store_true', help='Only count matching records')
+    args = parser.parse_args()
+
+    records = read_log(args.out)
+    fd = open_trace(args.output, 'w') if args.output else sys.stdout
+    try:
+        if args.command == 'merge':
+            for record in records:
+                fd.write(json.dumps(record, separators=(',', ':')) + '\n')
+        elif args.command == 'db':
+            to_db(records, fd)
+        elif args.count:
+            print(sum(1 for record in records if matches(record, args)), file=fd)
+        else:
+            for record in records:
+                if matches(record, args):
+                    fd.write(json.dumps(record, separators=(',', ':')) + '\n')
+    finally:
+        if fd is not sys.stdout:
+            fd.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+""" Transition report
+Summary of the transitions a campaign found, read in one pass from its
+transition log (or from a transition.db written before the log existed):
+
+  views      transitions per view (priv, func, all)
+  csrs       transitions per CSR that changed
+  instrs     transitions per instruction key, and per mnemonic
+  templates  transitions and tests per template
+  seeds      transitions per data seed
+  workers    transitions per worker
+  discovery  new transitions per time bucket (per iteration bucket for a
+             transition.db), with the running total, to see saturation
+
+python -m coverage.transition_report <out or transition.db> [--json]
+prints tables, or one JSON object with --json.
+"""
+
+import os
+import sys
+import json
+import argparse
+from collections import Counter, defaultdict
+
+from common.compression import open_trace
+from coverage.transition_log import read_log, segments
+
+LABELS = { 'PRIVILEGE': 'priv', 'FLOAT': 'func' }
+
+def read_db(path):
+    """Records of a transition.db, as the transition log holds them"""
+    pending = []
+    with open_trace(path) as fd:
+        lines = iter(fd)
+        for line in lines:
+            words = line.split()
+            if not words:
+                continue
+            if words[0] in LABELS:
+                before = next(lines).strip()
+                after = next(lines).strip()
+                pending.append({ 'type': 'trn', 'kind': LABELS[words[0]],
+                                 'instr': ' '.join(words[1:]), 'csrs': [],
+                                 'before_text': before, 'after_text': after,
+                                 'worker': None, 'time': None })
+            elif words[0] == 'test':
+                it = int(words[1])
+                for record in pending:
+                    record['it'] = it
+                    yield record
+                pending = []
+                transitions = int(next(lines).split(':')[1])
+                instructions = int(next(lines).split(':')[1])
+                yield { 'type': 'test', 'it': it, 'transitions': transitions,
+                        'instructions': instructions, 'worker': None, 'time': None }
+
+def read_records(path):
+    """Records of a campaign directory's log, or of a transition.db"""
+    if os.path.isdir(path):
+        if segments(path):
+            return read_log(path)
+        db = os.path.join(path, 'transition.db')
+        if not os.path.exists(db):
+            raise FileNotFoundError('No transition log or transition.db in {}'.format(path))
+        return read_db(db)
+    return read_db(path)
+
+
+class TransitionReport():
+    def __init__(self, bucket=600.0, it_bucket=1000):
+        self.bucket = bucket
+        self.it_bucket = it_bucket
+
+        self.views = Counter()
+        self.csrs = Counter()
+        self.instrs = Counter()
+        self.mnemonics = Counter()
+        self.workers = Counter()
+        self.templates = defaultdict(lambda: { 'tests': 0, 'transitions': 0 })
+        self.seeds = Counter()
+        self.discovery = Counter()
+
+        self.start = None
+        self.end = None
+        self.tests = 0
+        self.instructions = 0
+        self.last_it = None
+
+    def add(self, record):
+        if record['type'] == 'test':
+            self.tests += 1
+            self.instructions += record['instructions']
+            self.last_it = record['it'] if self.last_it is None else max(self.last_it, record['it'])
+            template = self.templates[record.get('template')]
+            template['tests'] += 1
+            template['transitions'] += record['transitions']
+            if record.get('seed') is not None:
+                self.seeds[record['seed']] += record['transitions']
+            return
+
+        self.views[record['kind']] += 1
+        for csr in record['csrs']:
+            self.csrs[csr] += 1
+        self.instrs[record['instr']] += 1
+        self.mnemonics[record['instr'].split()[0]] += 1
+        self.workers[record['worker']] += 1
+
+        if record['time'] is None:
+            # transition.db has no times, bucket by iteration
+            self.discovery[record['it'] // self.it_bucket * self.it_bucket] += 1
+            return
+        if self.start is None:
+            self.start = record['time']
+        self.end = record['time']
+        self.discovery[int((record['time'] - self.start) // self.bucket)] += 1
+
+    def timeline(self):
+        """(bucket start, new transitions, total) rows, in order"""
+        rows = []
+        total = 0
+        by_time = self.start is not None
+        for key in range(0, max(self.discovery, default=-1) + 1, 1 if by_time else self.it_bucket):
+            total += self.discovery[key]
+            rows.append((key * self.bucket if by_time else key, self.discovery[key], total))
+        return rows
+
+    def to_dict(self, top=None):
+        return {
+            'transitions': sum(self.views.values()),
+            'tests': self.tests,
+            'instructions': self.instructions,
+            'last_iteration': self.last_it,
+            'seconds': (self.end - self.start) if self.start is not None else None,
+            'views': dict(self.views),
+            'csrs': dict(self.csrs.most_common(top)),
+            'instrs': dict(self.instrs.most_common(top)),
+            'mnemonics': dict(self.mnemonics.most_common(top)),
+            'templates': { str(name): stats for (name, stats) in self.templates.items() },
+            'seeds': { str(seed): n for (seed, n) in self.seeds.most_common(top) },
+            'workers': { str(worker): n for (worker, n) in self.workers.most_common(top) },
+            'discovery': { 'unit': 'seconds' if self.start is not None else 'iterations',
+                           'rows': self.timeline() },
+        }
+
+    def print_tables(self, fd, top=20):
+        report = self.to_dict(top)
+        print('[ProcessorFuzz] {} transitions in {} tests ({} instructions)'.format(
+            report['transitions'], report['tests'], report['instructions']), file=fd)
+        for name in ['views', 'csrs', 'instrs', 'mnemonics', 'seeds', 'workers']:
+            print('\n{}'.format(name), file=fd)
+            for (key, n) in report[name].items():
+                print('  {:<32} {:>10}'.format(key, n), file=fd)
+        print('\ntemplates', file=fd)
+        for (name, stats) in report['templates'].items():
+            print('  {:<32} {:>10} {:>10} tests'.format(name, stats['transitions'], stats['tests']),
+                  file=fd)
+        print('\ndiscovery ({})'.format(report['discovery']['unit']), file=fd)
+        for (start, new, total) in report['discovery']['rows']:
+            print('  {:<12g} {:>10} {:>10}'.format(start, new, total), file=fd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the transitions of a campaign')
+    parser.add_argument('path', type=str, help='Campaign output directory or transition.db')
+    parser.add_argument('--json', action='store_true', help='Print one JSON object')
+    parser.add_argument('--top', type=int, default=20,
+                        help='Rows per table, 0 for all')
+    parser.add_argument('--bucket', type=float, default=600.0,
+                        help='Discovery bucket in seconds')
+    parser.add_argument('--it_bucket', type=int, default=1000,
+                        help='Discovery bucket in iterations, for transition.db')
+    args = parser.parse_args()
+
+    report = TransitionReport(args.bucket, args.it_bucket)
+    for record in read_records(args.path):
+        report.add(record)
+
+    top = args.top or None
+    if args.json:
+        json.dump(report.to_dict(top), sys.stdout, indent=1)
+        print()
+    else:
+        report.print_tables(sys.stdout, top)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+""" Transition store
+Transitions seen so far in the campaign, as hash sets instead of the lists
+extract_transitions used to scan for every instruction. A transition is the
+instruction (with its CSR for CSR instructions) and the CSR vectors before
+and after it, kept per view of the CSR vector (see csr_vector):
+
+  priv   privileged CSRs
+  func   floating-point CSRs
+  all    the whole vector, of every novel transition (ALL_CSR mode checks it)
+
+observe() applies the novelty rules of extract_transitions: a transition is
+new for a view when the view changed and (instruction, before, after) was not
+seen in it. An instruction that writes one of mstatus, mcause, scause or
+fflags and changes only that CSR is skipped (criteria 2).
+
+CSR vectors are given as field values and each view is packed into one
+integer, 64 bits per field, so keys are built without string concatenation.
+"""
+
+import sys
+
+from coverage.csr_vector import ALL, PRIV, FUNC, DEFAULT
+
+CSR_NAMES = ['mstatus', 'mcause', 'scause', 'fflags']
+CSR_WRITES = ['csrw', 'csrs', 'csrc', 'csrwi', 'csrsi', 'csrci']
+
+def instr_key(instr):
+    """(instruction key, CSR it accesses or '') of a disassembled instruction"""
+    instr_t = instr.split()[0].strip()
+    csr = ''
+    if 'csrr' in instr: #Ex: csrrsi  a2, frm, 25
+        instr_t += ' ' + instr.split(',')[1].strip() #Ex: csrrsi frm
+        csr = instr.split(',')[1].strip()
+    elif instr_t in CSR_WRITES:
+        instr_t = ' '.join(instr.split(',')[0].split())
+        csr = instr.split(',')[0].split()[1]
+    if csr == 'sstatus': csr = 'mstatus' #Treat mstatus same as sstatus
+    return (sys.intern(instr_t), csr)
+
+
+class TransitionStore():
+    def __init__(self):
+        self.seen = { ALL: set(), PRIV: set(), FUNC: set() }
+
+    def is_new(self, kind, instr_t, before, after):
+        return before != after and (instr_t, before, after) not in self.seen[kind]
+
+    def add(self, kind, instr_t, before, after):
+        """Record a transition, True if it was not seen before"""
+        key = (instr_t, before, after)
+        seen = self.seen[kind]
+        if key in seen:
+            return False
+        seen.add(key)
+        return True
+
+    def observe(self, instr, prev, cur, vector=DEFAULT):
+        """Record the change from CSR vector prev to cur made by instr
+
+        prev and cur are field values of the vector (CsrVector.values).
+        Returns the new transitions as (kind, instruction key, before, after)
+        with packed keys, in the order of the vector's views, empty when
+        nothing is new or criteria 2 applies.
+        """
+        if vector.csr_class:
+            (instr_t, csr) = instr_key(instr)
+        else:
+            (instr_t, csr) = (sys.intern(instr.split()[0].strip()), '')
+        if vector.criteria2 and csr in CSR_NAMES:
+            # Criteria 2: writing a CSR and changing only that CSR
+            changed = vector.changed_names(prev, cur, CSR_NAMES)
+            if sum(changed) == 1 and changed[CSR_NAMES.index(csr)]:
+                return []
+
+        before = vector.keys(prev)
+        after = vector.keys(cur)
+        new = []
+        # add() decides, stores shared between workers can race between checks
+        for view in vector.views:
+            if before[view] != after[view] and self.add(view, instr_t, before[view], after[view]):
+                new.append((view, instr_t, before[view], after[view]))
+        if new and vector.track_all:
+            self.add(ALL, instr_t, before[ALL], after[ALL])
+        return new
+
+    def count(self, kind=None):
+        """Transitions seen, of one view or of priv and func together"""
+        if kind is None:
+            return len(self.seen[PRIV]) + len(self.seen[FUNC])
+        return len(self.seen[kind])
+
+    def snapshot(self):
+        """Copy of the seen sets, by view"""
+        return { kind: set(seen) for (kind, seen) in self.seen.items() }
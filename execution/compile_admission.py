@@ -0,0 +1,183 @@
+""" Compile admission
+Gates compiler invocations on memory instead of re-running gcc every time
+the OOM killer takes it. Node-wide concurrency is bounded by slot files that
+every worker on the node flocks (the kernel drops the lock if a worker dies),
+and a slot is only used while MemAvailable covers the peak RSS observed for
+the template being compiled. A compile killed with SIGKILL is retried with
+exponential backoff, at most max_retries times.
+
+A template whose peak RSS is more than the node has runs alone: it takes
+every slot, in order, and waits for this process's reservations to drain.
+The estimate doubles after an OOM kill and decays back towards the observed
+peak by `decay` with every compile that completes.
+"""
+
+import os
+import time
+import fcntl
+import random
+import tempfile
+import subprocess
+import threading
+
+OOM_KILLED = -9
+
+MB = 1024 * 1024
+
+def default_lock_dir():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'processorfuzz_compile')
+
+def mem_available():
+    """MemAvailable of the node in bytes"""
+    try:
+        with open('/proc/meminfo', 'r') as fd:
+            for line in fd:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+class CompileAdmission():
+    def __init__(self, max_jobs=None, lock_dir=None, reserve_mb=512, default_rss_mb=256,
+                 max_retries=5, backoff=0.5, max_backoff=30.0, poll=0.05, decay=0.5):
+        self.max_jobs = max_jobs or os.cpu_count() or 1
+        self.lock_dir = lock_dir or default_lock_dir()
+        self.reserve = reserve_mb * MB
+        self.default_rss = default_rss_mb * MB
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.poll = poll
+        self.decay = decay
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+        # Per template: peak RSS estimate and counters
+        self.lock = threading.Lock()
+        self.peak_rss = {}
+        self.reserved = 0
+        self.stats = {}
+
+    def estimate(self, template):
+        return self.peak_rss.get(template, self.default_rss)
+
+    def _count(self, template, name, n=1):
+        stats = self.stats.setdefault(template, { 'compiles': 0, 'oom': 0,
+                                                  'retries': 0, 'waits': 0,
+                                                  'alone': 0, 'failed': 0 })
+        stats[name] += n
+
+    def _try_slot(self, n):
+        fd = os.open(os.path.join(self.lock_dir, 'slot_{}'.format(n)),
+                     os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _fits(self, need):
+        # Reservations cover compiles of this process that have not grown yet
+        return mem_available() - self.reserved - self.reserve >= need
+
+    def _acquire_all(self, template, need):
+        """Block until this compile holds every node slot and nothing else is reserved"""
+        fds = []
+        try:
+            # In slot order, two compiles running alone cannot deadlock
+            for n in range(self.max_jobs):
+                fd = os.open(os.path.join(self.lock_dir, 'slot_{}'.format(n)),
+                             os.O_RDWR | os.O_CREAT, 0o666)
+                fds.append(fd)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            while True:
+                with self.lock:
+                    if self.reserved == 0:
+                        self.reserved += need
+                        self._count(template, 'alone')
+                        return (fds, need)
+                time.sleep(self.poll)
+        except BaseException:
+            for fd in fds:
+                os.close(fd)
+            raise
+
+    def acquire(self, template):
+        """Block until a node slot is free and memory fits, return the slot"""
+        need = self.estimate(template)
+        # A template heavier than the whole node must still make progress, on its own
+        if need + self.reserve >= mem_available() + self.reserved:
+            return self._acquire_all(template, need)
+        start = random.randrange(self.max_jobs)
+        waited = False
+        while True:
+            for k in range(self.max_jobs):
+                fd = self._try_slot((start + k) % self.max_jobs)
+                if fd is None:
+                    continue
+                with self.lock:
+                    if self._fits(need):
+                        self.reserved += need
+                        if waited: self._count(template, 'waits')
+                        return ([fd], need)
+                os.close(fd)
+                break
+            waited = True
+            time.sleep(self.poll)
+
+    def release(self, slot):
+        (fds, need) = slot
+        with self.lock:
+            self.reserved -= need
+        for fd in fds:
+            os.close(fd)
+
+    def _run(self, args, stdin=None):
+        """Run args, return (exit code, peak RSS in bytes of the process tree)"""
+        if stdin is None:
+            proc = subprocess.Popen(args)
+        else:
+            proc = subprocess.Popen(args, stdin=subprocess.PIPE)
+            try:
+                proc.stdin.write(stdin)
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        (_, status, rusage) = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        return (proc.returncode, rusage.ru_maxrss * 1024)
+
+    def run(self, args, template, stdin=None):
+        """Run a compile command under admission control, return its exit code"""
+        ret = OOM_KILLED
+        for attempt in range(self.max_retries + 1):
+            slot = self.acquire(template)
+            try:
+                (ret, rss) = self._run(args, stdin)
+            finally:
+                self.release(slot)
+
+            with self.lock:
+                self._count(template, 'compiles')
+                if ret != OOM_KILLED:
+                    # An estimate raised by OOM kills decays towards the peaks seen since
+                    old = self.peak_rss.get(template, 0)
+                    self.peak_rss[template] = max(rss, rss + int((old - rss) * self.decay))
+                    return ret
+
+                # Killed while growing, the observed peak is a lower bound
+                self._count(template, 'oom')
+                self.peak_rss[template] = max(2 * rss, 2 * self.estimate(template))
+
+            if attempt < self.max_retries:
+                self._count(template, 'retries')
+                delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+        with self.lock:
+            self._count(template, 'failed')
+        return ret
@@ -0,0 +1,104 @@
+""" Compile farm
+Compiles tests ahead of the simulators. A bounded pool of compiler workers
+turns mutator outputs into ready-to-simulate bundles, so the RTL loop only
+pops tests whose gcc/elf2hex/symbol work is already done. At most `depth`
+tests are in flight (submitted but not popped), which bounds both the
+look-ahead of the mutator and the scratch files on disk. on_compiled is
+called on each compiled bundle, e.g. to start its Spike run right away.
+"""
+
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+class compiledTest():
+    def __init__(self, it, sim_input, data, assert_intr, isa_input, rtl_input, symbols):
+        self.it = it
+        self.sim_input = sim_input
+        self.data = data
+        self.assert_intr = assert_intr
+
+        self.isa_input = isa_input
+        self.rtl_input = rtl_input
+        self.symbols = symbols
+        # Spike run started ahead of the RTL loop, if any
+        self.isa_future = None
+        # New transitions found by the ISA screen
+        self.transitions = None
+
+    def compiled(self):
+        return self.isa_input is not None and self.rtl_input is not None
+
+    def keep(self):
+        """Write the files of the test to out/tests"""
+        if self.compiled() and self.rtl_input.files is not None:
+            self.rtl_input.files.keep()
+
+    def close(self):
+        if self.compiled() and self.rtl_input.files is not None:
+            self.rtl_input.files.close()
+
+
+class CompileFarm():
+    def __init__(self, preprocessor, num_workers=4, depth=8, run_elf=None, on_compiled=None):
+        self.preprocessor = preprocessor
+        self.on_compiled = on_compiled
+        self.num_workers = num_workers
+        self.depth = max(depth, num_workers)
+        self.run_elf = run_elf
+
+        self.pool = ThreadPoolExecutor(max_workers=num_workers,
+                                       thread_name_prefix='compile')
+        self.ready = queue.Queue()
+        self.in_flight = 0
+
+    def _compile(self, it, sim_input, data, assert_intr):
+        try:
+            (isa_input, rtl_input, symbols) = \
+                self.preprocessor.process(sim_input, data, assert_intr, it, self.run_elf)
+        except Exception as e:
+            # A broken test must not stall the loop waiting for its bundle
+            print('[ProcessorFuzz] Compile worker failed on test {} -- {}'.format(it, e))
+            (isa_input, rtl_input, symbols) = (None, None, None)
+
+        bundle = compiledTest(it, sim_input, data, assert_intr,
+                              isa_input, rtl_input, symbols)
+        if self.on_compiled is not None and bundle.compiled():
+            self.on_compiled(bundle)
+        self.ready.put(bundle)
+
+    def full(self):
+        return self.in_flight >= self.depth
+
+    def empty(self):
+        return self.in_flight == 0
+
+    def submit(self, it, sim_input, data, assert_intr=False):
+        assert not self.full(), 'Compile farm is full'
+
+        self.in_flight += 1
+        self.pool.submit(self._compile, it, sim_input, data, assert_intr)
+
+    def fill(self, source, it, last_it):
+        """Submit source(n) for n = it, it+1, ... until full or past last_it
+
+        source returns (sim_input, data, assert_intr), or None to skip n.
+        Returns the first iteration number not submitted yet.
+        """
+        while not self.full() and it <= last_it:
+            test = source(it)
+            if test is not None:
+                (sim_input, data, assert_intr) = test
+                self.submit(it, sim_input, data, assert_intr)
+            it += 1
+        return it
+
+    def get(self):
+        """Pop the next compiled bundle, blocks only while none is ready"""
+        assert not self.empty(), 'No test submitted to the compile farm'
+
+        bundle = self.ready.get()
+        self.in_flight -= 1
+        return bundle
+
+    def close(self):
+        self.pool.shutdown(wait=True)
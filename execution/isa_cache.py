@@ -0,0 +1,126 @@
+""" ISA cache
+Spike is deterministic for a given ELF, command line and interrupt file, so
+its parsed result is cached under a hash of the three. A hit skips the Spike
+run: minimizer retries, seed replays, the interrupt second pass and replaying
+a corpus against new RTL then only cost RTL time.
+
+Entries are pickled IsaTraces (transition records, compared rows, write-backs)
+in one directory shared by every worker on the node. They are written to a
+temporary file and renamed into place, readers never see a partial entry. A
+hit refreshes the entry's mtime, when the directory grows past max_mb the
+least recently used entries are removed by whichever worker holds the lock.
+"""
+
+import os
+import time
+import fcntl
+import pickle
+import hashlib
+import tempfile
+
+MB = 1024 * 1024
+
+def default_cache_dir():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'processorfuzz_isa_cache')
+
+def hash_file(digest, path):
+    with open(path, 'rb') as fd:
+        for block in iter(lambda: fd.read(1 << 20), b''):
+            digest.update(block)
+
+
+class IsaCache():
+    def __init__(self, cache_dir=None, max_mb=1024, check_every=64):
+        self.dir = cache_dir or default_cache_dir()
+        self.max_size = max_mb * MB
+        self.check_every = check_every
+
+        os.makedirs(self.dir, exist_ok=True)
+        self.stats = { 'hits': 0, 'misses': 0, 'stores': 0, 'evicted': 0 }
+        self.stored = 0
+
+    def key(self, binary, args, intrfile=None):
+        """Key of a Spike run: ELF bytes, arguments and interrupt file contents"""
+        digest = hashlib.sha256()
+        hash_file(digest, binary)
+        digest.update(b'\0' + '\0'.join(args).encode() + b'\0')
+        if intrfile:
+            hash_file(digest, intrfile)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.dir, key + '.pkl')
+
+    def get(self, key):
+        """Cached value of the key or None"""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as fd:
+                value = pickle.load(fd)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.stats['misses'] += 1
+            return None
+        try: os.utime(path)
+        except OSError: pass
+        self.stats['hits'] += 1
+        return value
+
+    def put(self, key, value):
+        (fd, tmp) = tempfile.mkstemp(dir=self.dir, prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                pickle.dump(value, out, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path(key))
+        except OSError as e:
+            print('[ProcessorFuzz] ISA cache could not store {} -- {}'.format(key, e))
+            try: os.remove(tmp)
+            except OSError: pass
+            return
+        self.stats['stores'] += 1
+        self.stored += 1
+        if self.stored % self.check_every == 0:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_mb"""
+        fd = os.open(os.path.join(self.dir, '.lock'), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return  # Another worker is evicting
+            entries = []
+            total = 0
+            with os.scandir(self.dir) as it:
+                for entry in it:
+                    if not entry.name.endswith('.pkl'):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+            entries.sort()
+            for (_, size, path) in entries:
+                if total <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                    self.stats['evicted'] += 1
+                except OSError:
+                    pass
+                total -= size
+            # Leftovers of workers killed while storing
+            now = time.time()
+            with os.scandir(self.dir) as it:
+                for entry in it:
+                    if entry.name.startswith('.tmp_'):
+                        try:
+                            if now - entry.stat().st_mtime > 600:
+                                os.remove(entry.path)
+                        except OSError:
+                            pass
+        finally:
+            os.close(fd)
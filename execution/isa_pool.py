@@ -0,0 +1,129 @@
+""" ISA pool
+Runs Spike jobs on a bounded thread pool and hands results back as futures,
+so ISA simulation of the next tests overlaps with the RTL simulation of the
+current one. Every job runs in its own session (process group) with its own
+timeout: on expiry only that group is killed, never other children of the
+fuzzer. Logs can be streamed through a pipe to a parser instead of a file.
+"""
+
+import os
+import time
+import signal
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from common.constants import SUCCESS, TIME_OUT
+from common.compression import open_trace
+
+def run_job(cmd, timeout, **kwargs):
+    """Run cmd in a new session, return (return code, timed out)"""
+    proc = subprocess.Popen(cmd, start_new_session=True, **kwargs)
+    try:
+        proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        try: os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError: pass
+        proc.communicate()
+        return (proc.returncode, True)
+    return (proc.returncode, False)
+
+def tee(lines, fd):
+    for line in lines:
+        fd.write(line)
+        yield line
+
+def stream_job(build_cmd, consume, timeout, log=None, **kwargs):
+    """Run a job that writes its log to a pipe read by consume
+
+    build_cmd(log_path) returns the command, consume(lines) parses the log
+    as it is produced and may return before the end of it. The job is then
+    killed, it is not left blocked on a full pipe. When log is set the lines
+    that were read are also written to that file, compressed if its name
+    says so.
+
+    Returns (return code, timed out, value returned by consume), the return
+    code is None when the job was stopped because consume was done.
+    """
+    (rfd, wfd) = os.pipe()
+    try:
+        proc = subprocess.Popen(build_cmd('/dev/fd/{}'.format(wfd)), pass_fds=(wfd,),
+                                start_new_session=True, **kwargs)
+    except OSError:
+        os.close(rfd)
+        raise
+    finally:
+        os.close(wfd)
+
+    expired = []
+    def kill():
+        expired.append(True)
+        try: os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError: pass
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+
+    stopped = False
+    try:
+        with os.fdopen(rfd, 'r') as lines:
+            if log is None:
+                value = consume(lines)
+            else:
+                with open_trace(log, 'w') as fd:
+                    value = consume(tee(lines, fd))
+            if proc.poll() is None:
+                # Done with the log before the job ended
+                stopped = True
+                try: os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError: pass
+    finally:
+        timer.cancel()
+        proc.wait()
+
+    if expired:
+        return (proc.returncode, True, value)
+    return (None if stopped else proc.returncode, False, value)
+
+
+class IsaPool():
+    def __init__(self, isa_sim, out_dir, num_workers=2, timeout=None, tiers=None, timeouts=None):
+        self.isa_sim = isa_sim
+        self.out_dir = out_dir
+        self.timeout = timeout
+        self.tiers = tiers  # TierPolicy fed with the run times, if any
+        self.timeouts = timeouts  # IsaTimeouts, per-template limits replacing timeout
+
+        self.pool = ThreadPoolExecutor(max_workers=num_workers,
+                                       thread_name_prefix='spike')
+        self.lock = threading.Lock()
+        self.stats = { 'jobs': 0, 'timeouts': 0, 'failed': 0 }
+
+    def _run(self, isa_input, it, assert_intr, commits, template):
+        timeout = self.timeout
+        if self.timeouts is not None and template is not None:
+            timeout = self.timeouts.timeout(template, commits)
+        start = time.monotonic()
+        (ret, isa_csv) = self.isa_sim.run_test(isa_input, self.out_dir, it, assert_intr,
+                                               timeout=timeout, commits=commits)
+        elapsed = time.monotonic() - start
+        # Cache hits take milliseconds, they say nothing of Spike's run times
+        ran = not (ret == SUCCESS and isa_csv.cached)
+        if self.tiers is not None and ret == SUCCESS and ran:
+            self.tiers.record_run(commits, elapsed)
+        if self.timeouts is not None and template is not None and ran and \
+                ret in [SUCCESS, TIME_OUT]:
+            self.timeouts.record(template, elapsed, ret == TIME_OUT, commits)
+        with self.lock:
+            self.stats['jobs'] += 1
+            if ret == TIME_OUT:
+                self.stats['timeouts'] += 1
+            elif ret != SUCCESS:
+                self.stats['failed'] += 1
+        return (ret, isa_csv)
+
+    def submit(self, isa_input, it, assert_intr=False, commits=True, template=None):
+        """Queue a Spike run, the future resolves to (result, isa_csv)"""
+        return self.pool.submit(self._run, isa_input, it, assert_intr, commits, template)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
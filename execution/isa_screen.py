@@ -0,0 +1,80 @@
+""" ISA screen
+Screens compiled tests on Spike before any RTL time is spent on them. Spike
+runs of the tests in the compile farm already proceed in parallel on the
+ISA pool, the screen collects their traces, counts the transitions each test
+adds to the transition set and drops tests that add none (the trns == 0 rule
+of the original loop). Novel tests wait in a heap and are handed to the RTL
+simulator most novel first, ties broken by iteration number.
+"""
+
+import heapq
+
+from common.utils import extract_transitions
+from common.constants import SUCCESS
+from mutation.mutator import templates
+
+class IsaScreen():
+    def __init__(self, farm, out_dir, all_csr=False, fp_csr=False, width=8, on_screened=None,
+                 vector=None):
+        self.farm = farm
+        # Called with (bundle, novel) on every screened test
+        self.on_screened = on_screened
+        self.out_dir = out_dir
+        self.all_csr = all_csr
+        self.fp_csr = fp_csr
+        # CSR vector transitions are tracked on, the all_csr / fp_csr preset if None
+        self.vector = vector
+        # Novel tests held back to rank before RTL picks one
+        self.width = max(width, 1)
+
+        self.heap = []
+        self.stats = { 'screened': 0, 'rejected': 0, 'isa_failed': 0 }
+
+    def screen(self, bundle):
+        """Count the new transitions of a compiled test, keep it if there are any"""
+        self.stats['screened'] += 1
+        if not bundle.compiled() or bundle.isa_future is None:
+            # Compile failed or no Spike run, RTL has nothing to do either
+            self.stats['isa_failed'] += 1
+            bundle.close()
+            return 0
+
+        (isa_result, isa_trace) = bundle.isa_future.result()
+        if isa_result != SUCCESS:
+            self.stats['isa_failed'] += 1
+            bundle.close()
+            return 0
+
+        trns = extract_transitions(isa_trace, self.out_dir, bundle.it,
+                                   self.all_csr, self.fp_csr, self.vector,
+                                   template=templates[bundle.sim_input.get_template()],
+                                   seed=bundle.sim_input.get_seed())
+        bundle.transitions = trns
+        if self.on_screened is not None:
+            self.on_screened(bundle, trns > 0)
+        if trns == 0:
+            # Don't do RTL sim if the test does not have unique transitions
+            self.stats['rejected'] += 1
+            bundle.close()
+            return 0
+
+        heapq.heappush(self.heap, (-trns, bundle.it, bundle))
+        return trns
+
+    def ready(self):
+        """True once enough novel tests are held, or the farm has no more"""
+        return len(self.heap) >= self.width or (self.heap and self.farm.empty())
+
+    def pull(self):
+        """Screen the next compiled test of the farm"""
+        return self.screen(self.farm.get())
+
+    def get(self):
+        """Most novel screened test, None when none is left"""
+        if not self.heap:
+            return None
+        return heapq.heappop(self.heap)[2]
+
+    def close(self):
+        while self.heap:
+            heapq.heappop(self.heap)[2].close()
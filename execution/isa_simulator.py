@@ -2,73 +2,99 @@ import os
 import subprocess
 # from common.utils import debug_print
 from common.constants import SUCCESS, TIME_OUT
+from execution.isa_pool import stream_job
+from execution.isa_trace import IsaTrace
+from common.compression import record_path
 
 class ISA_Simulator:
-    def __init__(self, debug=False, spike_path="spike"):
+    def __init__(self, debug=False, spike_path="spike", timeout=30, stop_at_end=True,
+                 cache=None):
         self.debug = debug
         self.spike_path = spike_path  # Path to Spike ISA simulator
+        self.timeout = timeout  # Per-job limit in seconds
+        self.stop_at_end = stop_at_end  # Past the end of the test, the log is not read
+        self.cache = cache  # IsaCache shared by the workers of the node, if any
     
     def debug_print(self, message):
         if self.debug:
             print(message)
 
-    def run_test(self, isa_input, out_dir, it, assert_intr=False):
-        """Run test on Spike and generate trace log"""
-        isa_log = f"{out_dir}/trace/isa_{it}.log"
-        self.debug_print(f"Running ISA test {it} -> {isa_log}", self.debug)
+    def run_test(self, isa_input, out_dir, it, assert_intr=False, timeout=None, commits=True):
+        """Run test on Spike, return its IsaTrace parsed while Spike runs
+
+        trace.cached tells a cache hit, its run time is not Spike's.
+
+        Without commits, Spike only logs the commit line of each instruction:
+        enough for transitions, not for the comparison with RTL.
+        """
+        # The log and CSV only reach the disk when debugging, compressed if
+        # PROCESSORFUZZ_COMPRESS is set
+        isa_csv = record_path(f"{out_dir}/trace/isa_{it}.csv")
+        isa_log = record_path(f"{out_dir}/trace/isa_{it}.log") if self.debug else None
+        self.debug_print(f"Running ISA test {it}")
 
         # Command to run Spike with trace generation
-        cmd = [
-            self.spike_path,
-            "--log", isa_log,
-            "--isa=rv64g",  # RISC-V ISA configuration
-            isa_input.binary  # Use 'binary' attribute to match original isaInput structure
-        ]
+        def build_cmd(log_path, intr_path=None):
+            cmd = [self.spike_path, "-l"]
+            if commits:
+                cmd.append("--log-commits")
+            cmd.extend([
+                f"--log={log_path}",
+                "--isa=rv64g",  # RISC-V ISA configuration
+            ])
+            # Add interrupt handling if needed
+            if assert_intr and isa_input.intrfile:
+                cmd.extend(["--intr", intr_path or isa_input.intrfile])
+            # Use 'binary' attribute to match original isaInput structure
+            return cmd + [isa_input.binary]
 
-        # Add interrupt handling if needed
-        if assert_intr and isa_input.intrfile:
-            cmd.extend(["--intr", isa_input.intrfile])
+        # Same ELF, arguments and interrupt file give the same trace
+        key = None
+        if self.cache is not None:
+            intrfile = isa_input.intrfile if assert_intr else None
+            # The interrupt file path is per process, its contents are hashed instead
+            args = build_cmd('-', 'intr')[:-1] + [f"stop_at_end={self.stop_at_end}"]
+            key = self.cache.key(isa_input.binary, args, intrfile)
+            trace = self.cache.get(key)
+            if trace is not None:
+                self.debug_print(f"ISA result of test {it} found in cache")
+                trace.cached = True
+                if self.debug:
+                    trace.write_csv(isa_csv)
+                return (SUCCESS, trace)
 
-        # Execute Spike
-        try:
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=30  # Prevent hanging
-            )
-        except subprocess.TimeoutExpired:
-            self.debug_print(f"ISA simulation timed out (test {it})", self.debug)
+        # Spike runs in its own process group, a timeout only kills this job.
+        # The parser stops at the end of the test and Spike is stopped there.
+        (returncode, timed_out, trace) = stream_job(
+            build_cmd,
+            lambda lines: IsaTrace.parse(lines, self.stop_at_end),
+            timeout or self.timeout,
+            log=isa_log,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        if timed_out:
+            self.debug_print(f"ISA simulation timed out (test {it})")
             return (TIME_OUT, None)
 
         # Check for errors
-        if result.returncode != 0:
-            self.debug_print(
-                f"ISA simulation failed (test {it}): {result.stderr.decode()}",
-                self.debug
-            )
-            return (result.returncode, None)
+        if returncode not in [None, 0]:
+            self.debug_print(f"ISA simulation failed (test {it}): {returncode}")
+            return (returncode, None)
 
-        # Process log into CSV (from spike_log_to_trace_csv)
-        isa_csv = f"{out_dir}/trace/isa_{it}.csv"
-        self._log_to_csv(isa_log, isa_csv)
-        return (SUCCESS, isa_csv)
-
-    def _log_to_csv(self, log_path, csv_path):
-        """Convert Spike log to CSV trace (simplified version)"""
-        with open(log_path, "r") as log_fd, open(csv_path, "w") as csv_fd:
-            csv_fd.write("pc,inst,rd,rd_val\n")  # CSV header
-            for line in log_fd:
-                if "core   0: 0x" in line:  # Extract instruction entries
-                    parts = line.strip().split()
-                    pc = parts[2]
-                    inst = parts[3]
-                    rd = parts[5] if len(parts) > 5 else "x0"
-                    rd_val = parts[7] if len(parts) > 7 else "0"
-                    csv_fd.write(f"{pc},{inst},{rd},{rd_val}\n")
+        trace.commits = commits
+        if not commits:
+            # Without write-backs the fingerprint does not pin the path down
+            trace.path = None
+        if key is not None:
+            self.cache.put(key, trace)
+        if self.debug:
+            trace.write_csv(isa_csv)
+        return (SUCCESS, trace)
 
 
 class isaInput:
-    def __init__(self, binary, intrfile):
+    def __init__(self, binary, intrfile, files=None):
         self.binary = binary  # ELF path
-        self.intrfile = intrfile  # Interrupt files
\ No newline at end of file
+        self.intrfile = intrfile  # Interrupt files
+        self.files = files  # testFiles backing the paths
\ No newline at end of file
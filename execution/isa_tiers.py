@@ -0,0 +1,59 @@
+""" ISA tiers
+Spike runs come in two tiers. A screening run uses -l alone: the commit line
+of each instruction, with its CSR vector, is all transition extraction needs.
+A full run adds --log-commits for the write-backs the RTL comparison needs.
+Tests that fail screening never need the full run.
+
+Screening first costs screen + survival * full, running the full tier
+directly costs full. TierPolicy keeps moving averages of both run times and
+of the screening survival rate and picks the cheaper plan for each test.
+Once in a while it tries the other plan, so that its estimates stay current.
+"""
+
+import random
+import threading
+
+class TierPolicy():
+    def __init__(self, alpha=0.05, explore=0.02, warmup=8):
+        self.alpha = alpha  # Weight of a new sample in the moving averages
+        self.explore = explore
+        self.warmup = warmup
+
+        self.lock = threading.Lock()
+        self.cost = { True: None, False: None }  # Seconds per run, by commits
+        self.runs = { True: 0, False: 0 }
+        self.survival = 1.0
+        self.screened = 0
+
+    def _update(self, old, new):
+        return new if old is None else old + self.alpha * (new - old)
+
+    def record_run(self, commits, seconds):
+        with self.lock:
+            self.cost[commits] = self._update(self.cost[commits], seconds)
+            self.runs[commits] += 1
+
+    def record_screen(self, novel):
+        with self.lock:
+            self.survival = self._update(None if self.screened == 0 else self.survival,
+                                         1.0 if novel else 0.0)
+            self.screened += 1
+
+    def screen_first(self):
+        """True to run the screening tier first, False for the full tier only"""
+        with self.lock:
+            # Measure both tiers before trusting the estimates
+            if self.runs[False] < self.warmup:
+                return True
+            if self.runs[True] < self.warmup:
+                return False
+            cheaper = self.cost[False] + self.survival * self.cost[True] < self.cost[True]
+        if random.random() < self.explore:
+            return not cheaper
+        return cheaper
+
+    def stats(self):
+        with self.lock:
+            return { 'screen_cost': self.cost[False], 'full_cost': self.cost[True],
+                     'survival': self.survival, 'screened': self.screened,
+                     'screen_runs': self.runs[False], 'full_runs': self.runs[True] }
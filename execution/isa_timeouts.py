@@ -0,0 +1,94 @@
+""" ISA timeouts
+Spike timeouts per template, from the run times observed for that template
+instead of one limit for all: p-m tests end in milliseconds, V_U tests take
+far longer. The limit is the `quantile` of the last `window` completed run
+times times `factor`, clamped to [floor, ceiling]. Until min_samples runs of
+a template are seen, its limit is `default`.
+
+Timed-out runs only count in the stats, hung tests never push the limit up.
+The limit may grow by `growth` per `window` runs at most: when more than
+`max_timeout_rate` of a window's runs time out, the template is taken to be
+slower than its limit and the limit grows by that one step. Screening and
+full runs (see isa_tiers) are tracked apart.
+"""
+
+import threading
+from collections import deque
+
+class IsaTimeouts():
+    def __init__(self, default=30.0, floor=0.5, ceiling=120.0, factor=4.0, quantile=0.99,
+                 window=512, min_samples=20, growth=2.0, max_timeout_rate=0.1):
+        self.default = default
+        self.floor = floor
+        self.ceiling = ceiling
+        self.factor = factor
+        self.quantile = quantile
+        self.window = window
+        self.min_samples = min_samples
+        self.growth = growth
+        self.max_timeout_rate = max_timeout_rate
+
+        self.lock = threading.Lock()
+        self.samples = {}  # (template, commits): recent completed run times
+        self.outcomes = {} # (template, commits): timed out or not, runs of this window
+        self.base = {}     # (template, commits): limit at the start of this window
+        self.limits = {}   # (template, commits): limit, None once stale
+        self.stats = {}    # template: counters
+
+    def _count(self, template, name):
+        stats = self.stats.setdefault(template, { 'runs': 0, 'timeouts': 0 })
+        stats[name] += 1
+
+    def _limit(self, key):
+        base = self.base.get(key, self.default)
+        samples = self.samples.get(key)
+        if samples is None or len(samples) < self.min_samples:
+            limit = self.default
+        else:
+            ordered = sorted(samples)
+            q = ordered[min(int(self.quantile * len(ordered)), len(ordered) - 1)]
+            limit = max(q * self.factor, self.floor)
+        limit = min(limit, base * self.growth)
+        outcomes = self.outcomes.get(key, [])
+        if len(outcomes) >= self.min_samples and \
+                sum(outcomes) > self.max_timeout_rate * len(outcomes):
+            # Too many runs cut, completed ones do not show how long they take
+            limit = max(limit, base * self.growth)
+        return min(limit, self.ceiling)
+
+    def timeout(self, template, commits=True):
+        """Limit in seconds for the next Spike run of the template"""
+        key = (template, commits)
+        with self.lock:
+            limit = self.limits.get(key)
+            if limit is None:
+                limit = self.limits[key] = self._limit(key)
+            return limit
+
+    def record(self, template, seconds, timed_out=False, commits=True):
+        key = (template, commits)
+        with self.lock:
+            if not timed_out:
+                samples = self.samples.get(key)
+                if samples is None:
+                    samples = self.samples[key] = deque(maxlen=self.window)
+                samples.append(seconds)
+            outcomes = self.outcomes.setdefault(key, [])
+            outcomes.append(timed_out)
+            if len(outcomes) >= self.window:
+                # Next window, growth is counted from the limit reached
+                self.base[key] = self._limit(key)
+                self.outcomes[key] = []
+            self.limits[key] = None
+            self._count(template, 'runs')
+            if timed_out:
+                self._count(template, 'timeouts')
+
+    def report(self):
+        """One line per template: runs, timeouts and current limit"""
+        lines = []
+        for template in sorted(self.stats):
+            stats = self.stats[template]
+            lines.append('[ProcessorFuzz] ISA timeouts {}: {}/{} runs, limit {:.2f}s'.format(
+                template, stats['timeouts'], stats['runs'], self.timeout(template)))
+        return lines
@@ -0,0 +1,296 @@
+""" ISA trace
+One pass over a Spike log (-l --log-commits) builds a columnar trace that
+every consumer shares: transition extraction, CSV export and the ISA/RTL
+comparison. Record i is the i-th commit line (the ones carrying the CSR
+vector in brackets), its columns are:
+
+  pc, csrs, instr      as split by extract_transitions (pc with 0x, raw CSRs)
+  addr, binary, disasm from CORE_RE, None when the line does not match it
+  gpr, mode, illegal   write-backs and privilege from the follow-on lines
+
+Transitions use every record, up to the end of the test: the trap handlers
+and fuzzed suffix run after the ecall of _fuzz_main. The comparison and the
+CSV only see the records read_spike_trace yields: past Spike's trampoline
+(PC 0x1010), up to and including that first ecall, in the order given by
+`compared`.
+
+`path` fingerprints the executed path while the log is parsed: a rolling
+hash over the compared records' address, instruction word, write-backs,
+privilege and CSR vector, None for logs without --log-commits.
+
+Lines are split by the fixed-position tokenizer, the regexes only see the
+lines it does not recognize. Binaries and disassembly are interned, a test
+loops over few distinct instructions.
+"""
+
+import sys
+import hashlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from execution.spike_log_to_trace_csv import CORE_RE, RD_RE, MEM_RE, CSR_RE, OTHER_RE, \
+    process_instr
+from execution.riscv_trace_csv import RiscvInstructionTraceEntry, RiscvInstructionTraceCsv, \
+    TRACE_FIELDS
+from execution.spike_tokenizer import split_core, split_effect
+from scripts.lib import convert_pseudo_instr, gpr_to_abi
+from common.compression import open_trace
+
+END_TRAMPOLINE = 0x1010
+
+CSV_FIELDS = TRACE_FIELDS
+
+def match_effect(line):
+    """(pri, rd, csr) of a follow-on line by the regexes, as split_effect"""
+    pri = None
+    (rd, csr) = (None, None)
+    commit = RD_RE.match(line)
+    if commit:
+        rd = (commit.group('reg').replace(' ', ''), commit.group('val'))
+        pri = commit.group('pri')
+    store = MEM_RE.match(line)
+    if store:
+        pri = store.group('pri')
+    csr_match = CSR_RE.match(line)
+    if csr_match:
+        csr = (csr_match.group('csr'), csr_match.group('val'))
+        pri = csr_match.group('pri')
+    other = OTHER_RE.match(line)
+    if other:
+        pri = other.group('pri')
+    return (pri, rd, csr)
+
+
+class IsaTrace():
+    def __init__(self):
+        self.pc = []
+        self.csrs = []
+        self.instr = []
+        # Bracket text of each record, compared whole to find CSR changes
+        self.vector = []
+
+        self.addr = []
+        self.binary = []
+        self.disasm = []
+
+        self.gpr = []
+        self.mode = []
+        self.illegal = []
+
+        # Records seen by the comparison, in order
+        self.compared = []
+        self.ended = False
+        # False for a log without --log-commits, gpr and mode are then empty
+        self.commits = True
+        # 64-bit fingerprint of the compared records
+        self.path = None
+        # True when run_test took the trace from the ISA cache, Spike did not run
+        self.cached = False
+
+    def __len__(self):
+        return len(self.pc)
+
+    @classmethod
+    def parse(cls, lines, stop_at_end=False):
+        """Build the trace from log lines, stop at the end of the test if asked to
+
+        The test ends in the _test_end loop, a jump to itself, once tohost
+        is written.
+        """
+        trace = cls()
+        in_trampoline = True
+        cur = None  # Record receiving follow-on lines, as read_spike_trace's instr
+        path = hashlib.blake2b(digest_size=8)
+        last = None  # Compared record not in the path yet, its follow-on lines may come
+
+        for line in lines:
+            core = None
+            if '[' in line:
+                n = len(trace.pc)
+                fields = split_core(line)
+                if fields is not None:
+                    (pc, core, binary, csrs, instr, disasm, vector) = fields
+                    trace.pc.append(pc)
+                    trace.csrs.append(csrs)
+                    trace.vector.append(vector)
+                    trace.instr.append(instr)
+                    trace.addr.append(core)
+                    trace.binary.append(sys.intern(binary))
+                    disasm = disasm.replace('pc + ', '').replace('pc - ', '-')
+                    trace.disasm.append(sys.intern(disasm))
+                else:
+                    core = trace.append_slow(line)
+                trace.gpr.append([])
+                trace.mode.append('')
+                trace.illegal.append(False)
+
+            if trace.ended:
+                if stop_at_end and core and trace.addr[n - 1] == core and \
+                        (trace.disasm[n] or '').startswith('j'):
+                    break
+                continue
+
+            if in_trampoline:
+                if core and int(core, 16) == END_TRAMPOLINE:
+                    in_trampoline = False
+                continue
+
+            if core:
+                if last is not None:
+                    path.update(trace.path_record(last))
+                last = n
+                cur = n
+                trace.compared.append(n)
+                if trace.disasm[n] == 'ecall':
+                    trace.ended = True
+                    cur = None
+                continue
+
+            if cur is None:
+                continue
+
+            if 'trap_illegal_instruction' in line:
+                trace.illegal[cur] = True
+                cur = None
+                continue
+
+            effect = split_effect(line)
+            if effect is None:
+                effect = match_effect(line)
+            (pri, rd, csr) = effect
+            if rd:
+                trace.gpr[cur].append(gpr_to_abi(rd[0]) + ':' + rd[1])
+            if csr:
+                trace.gpr[cur].append(csr[0] + ':' + csr[1])
+            if pri is not None:
+                trace.mode[cur] = pri
+
+        if last is not None:
+            path.update(trace.path_record(last))
+        trace.path = int.from_bytes(path.digest(), 'little')
+        return trace
+
+    def path_record(self, n):
+        """Bytes of record n hashed into the path"""
+        return '{}|{}|{}|{}|{}|{}\n'.format(self.addr[n], self.binary[n], ';'.join(self.gpr[n]),
+                                            self.mode[n], int(self.illegal[n]),
+                                            self.vector[n]).encode()
+
+    def append_slow(self, line):
+        """Regex path of a commit line, return its address or None"""
+        (head, _, rest) = line.partition('[')
+        (vals, _, instr) = rest.partition(']')
+        self.pc.append(line.split()[2])
+        self.csrs.append(vals.split(','))
+        self.vector.append(vals)
+        self.instr.append(instr.rstrip())
+
+        core = CORE_RE.match(line)
+        if not core:
+            self.addr.append(None)
+            self.binary.append(None)
+            self.disasm.append(None)
+            return None
+        self.addr.append(core.group('addr'))
+        self.binary.append(core.group('bin'))
+        self.disasm.append(core.group('instr').replace('pc + ', '').replace('pc - ', '-'))
+        return core.group('addr')
+
+    @classmethod
+    def read(cls, path, stop_at_end=False):
+        with open_trace(path, 'r') as fd:
+            return cls.parse(fd, stop_at_end)
+
+    def changes(self, width=8):
+        """Records whose first width CSRs differ from the previous record's
+
+        Whole bracket texts are compared first, vectorized when NumPy is
+        there, only the records that differ are split and compared per CSR.
+        """
+        if np is not None and len(self.vector) > 1:
+            vector = np.array(self.vector)
+            candidates = (np.flatnonzero(vector[1:] != vector[:-1]) + 1).tolist()
+        else:
+            candidates = [ n for n in range(1, len(self.vector))
+                           if self.vector[n] != self.vector[n - 1] ]
+        return [ n for n in candidates if self.csrs[n][:width] != self.csrs[n - 1][:width] ]
+
+    def csr_values(self, n, width=8):
+        """First width CSRs of record n as integers"""
+        return tuple(int(val, 16) for val in self.csrs[n][:width])
+
+    def csr_matrix(self, rows=None, width=8):
+        """uint64 matrix of the first width CSRs of the rows (all by default),
+        a list of tuples without NumPy"""
+        rows = range(len(self.csrs)) if rows is None else rows
+        values = [ self.csr_values(n, width) for n in rows ]
+        if np is None:
+            return values
+        return np.array(values, dtype=np.uint64).reshape(len(values), width)
+
+    def transition_records(self):
+        """(pc, csrs, instr) of every record, as extract_transitions reads them"""
+        return zip(self.pc, self.csrs, self.instr)
+
+    def row(self, n, full_trace=False):
+        """CSV row of record n, instr and operand are only filled for full traces"""
+        (instr, operand) = ('', '')
+        if full_trace:
+            entry = self.entry(n, True)
+            (instr, operand) = (entry.instr, entry.operand)
+        csrs = self.csrs[n]
+        return [ self.addr[n], instr, ';'.join(self.gpr[n]), '', self.binary[n],
+                 self.mode[n], self.disasm[n], operand, '', csrs[0][2:] ] + csrs[1:8]
+
+    def rows(self, full_trace=False):
+        """Rows of the compared records, as trace_compare reads them from the CSV"""
+        return [ self.row(n, full_trace) for n in self.compared ]
+
+    def entry(self, n, full_trace=True):
+        """Record n as a RiscvInstructionTraceEntry"""
+        entry = RiscvInstructionTraceEntry()
+        entry.pc = self.addr[n]
+        entry.instr_str = self.disasm[n]
+        entry.binary = self.binary[n]
+        (entry.mstatus, entry.frm, entry.fflags, entry.mcause, entry.scause,
+         entry.medeleg, entry.mcounteren, entry.scounteren) = \
+            [ self.csrs[n][0][2:] ] + self.csrs[n][1:8]
+        entry.gpr = list(self.gpr[n])
+        entry.mode = self.mode[n]
+
+        if full_trace:
+            opcode = entry.instr_str.split(' ')[0]
+            operand = entry.instr_str[len(opcode):].replace(' ', '')
+            entry.instr, entry.operand = convert_pseudo_instr(opcode, operand, entry.binary)
+            process_instr(entry)
+        return entry
+
+    def csv_entries(self, full_trace=True):
+        """Entries of the compared records that process_spike_sim_log would write"""
+        for n in self.compared:
+            entry = self.entry(n, full_trace)
+            if not (full_trace or entry.gpr or entry.instr_str in ['wfi', 'ecall']):
+                continue
+            yield entry
+
+    def write_csv(self, path, full_trace=True):
+        """Export the compared records as process_spike_sim_log would"""
+        with open_trace(path, 'w') as fd:
+            trace_csv = RiscvInstructionTraceCsv(fd)
+            trace_csv.start_new_trace()
+            trace_csv.write_trace_entries(self.csv_entries(full_trace))
+        return path
+
+    def write_store(self, path, full_trace=True):
+        """Export the rows write_csv would write to a binary trace store"""
+        from execution.trace_store import TraceStoreWriter
+        with TraceStoreWriter(path) as store:
+            for entry in self.csv_entries(full_trace):
+                store.add([ entry.pc, entry.instr, ';'.join(entry.gpr), ';'.join(entry.csr),
+                            entry.binary, entry.mode, entry.instr_str, entry.operand, '',
+                            entry.mstatus, entry.frm, entry.fflags, entry.mcause, entry.scause,
+                            entry.medeleg, entry.mcounteren, entry.scounteren ])
+        return path
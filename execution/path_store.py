@@ -0,0 +1,113 @@
+""" Path store
+Executed paths (IsaTrace.path, a 64-bit fingerprint of the compared records)
+whose RTL run was already compared, shared by every worker on the node. A
+test whose path is in the store runs the same instructions, write-backs and
+CSR states as a test RTL already checked, its RTL run is skipped.
+
+The store is bounded: an mmap'd set-associative table of `capacity` slots in
+sets of `ways`. A path goes to an empty way of its set, or replaces the way
+given by its fingerprint when the set is full, so old paths are forgotten
+rather than the table growing. Forgetting a path only costs an RTL run.
+Fingerprints are compared whole, a path is never taken as seen by mistake
+short of a 64-bit collision. Slots are read and written without locks.
+
+A path is only seen for the RTL it was compared on: the store is named
+after the output directory, the toplevel and the simulator build (the
+executable running the fuzzer, its size and mtime). Another DUT, or a
+rebuilt one, starts with an empty store.
+"""
+
+import os
+import sys
+import mmap
+import fcntl
+import struct
+import hashlib
+import tempfile
+
+MAGIC = b'PFPATH01'
+# magic, capacity (slots), ways
+HEADER = struct.Struct('<8sQQ')
+SLOT = struct.Struct('<Q')
+
+def rtl_identity(toplevel):
+    """Toplevel and build of the RTL simulator, the executable of this process under cocotb"""
+    exe = '/proc/self/exe' if os.path.exists('/proc/self/exe') else sys.executable
+    exe = os.path.realpath(exe)
+    try:
+        st = os.stat(exe)
+        build = '{}:{}:{}'.format(exe, st.st_size, st.st_mtime_ns)
+    except OSError:
+        build = exe
+    return '{}\0{}'.format(toplevel, build)
+
+def default_store_path(out_dir, identity=''):
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    name = hashlib.sha1('{}\0{}'.format(os.path.abspath(out_dir), identity).encode()).hexdigest()[:12]
+    return os.path.join(base, 'processorfuzz_paths_{}.tbl'.format(name))
+
+
+class PathStore():
+    def __init__(self, out_dir, toplevel, capacity=1 << 20, ways=8, store_path=None):
+        self.path = store_path or default_store_path(out_dir, rtl_identity(toplevel))
+
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, HEADER.size, 0)
+        try:
+            if os.fstat(self.fd).st_size < HEADER.size:
+                capacity = max(capacity - capacity % ways, ways)
+                os.ftruncate(self.fd, HEADER.size + capacity * SLOT.size)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, capacity, ways), 0)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, HEADER.size, 0)
+
+        self.mm = mmap.mmap(self.fd, 0)
+        (magic, self.capacity, self.ways) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a path store'.format(self.path))
+        self.sets = self.capacity // self.ways
+
+        self.stats = { 'checked': 0, 'seen': 0, 'added': 0 }
+
+    def _slots(self, key):
+        first = (key % self.sets) * self.ways
+        return [ HEADER.size + (first + way) * SLOT.size for way in range(self.ways) ]
+
+    def seen(self, key):
+        """True if RTL already compared the path"""
+        if key is None:
+            return False
+        self.stats['checked'] += 1
+        key = key or 1  # 0 marks an empty slot
+        for offset in self._slots(key):
+            if SLOT.unpack_from(self.mm, offset)[0] == key:
+                self.stats['seen'] += 1
+                return True
+        return False
+
+    def add(self, key):
+        """Record the path of a compared test"""
+        if key is None:
+            return
+        key = key or 1
+        slots = self._slots(key)
+        for offset in slots:
+            value = SLOT.unpack_from(self.mm, offset)[0]
+            if value == key:
+                return
+            if value == 0:
+                SLOT.pack_into(self.mm, offset, key)
+                self.stats['added'] += 1
+                return
+        # Set full, evict the way the fingerprint picks
+        SLOT.pack_into(self.mm, slots[(key // self.sets) % self.ways], key)
+        self.stats['added'] += 1
+
+    def report(self):
+        return '[ProcessorFuzz] Path store: {} of {} tests skipped as already compared, ' \
+               '{} paths added'.format(self.stats['seen'], self.stats['checked'],
+                                       self.stats['added'])
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
@@ -1,18 +1,31 @@
 import os
 import subprocess
 import random
+import threading
 from shutil import copyfile
 from mutation.mutator import simInput, templates, V_U  # Supplement V_U constant definition
+from execution.symbol_layout import SymbolLayout, probe_template
+from execution.template_segments import TemplateSegments
+from execution.compile_admission import CompileAdmission
+from execution.toolchain import Toolchain, testFiles
 # from common.utils import debug_print
 
 class rvPreProcessor():
-    def __init__(self, cc, elf2hex, template='Template', out_base='.', proc_num=0):
+    def __init__(self, cc, elf2hex, template='Template', out_base='.', proc_num=0, verify_layout=False,
+                 admission=None, in_memory=False, scratch=None):
         self.cc = cc
         self.elf2hex = elf2hex
         self.template = template
         self.base = out_base
         self.proc_num = proc_num
         self.er_num = 0
+
+        # Symbol layouts learned per (template version, interrupt)
+        self.layouts = {}
+        self.segments = {}
+        self.layout_lock = threading.Lock()
+        self.verify_layout = verify_layout
+        self.ld_name = os.path.join(template, 'include', 'link.ld')
         self.cc_args = [
             cc, '-march=rv64g', '-mabi=lp64', '-static', '-mcmodel=medany',
             '-fvisibility=hidden', '-nostdlib', '-nostartfiles',
@@ -22,6 +35,14 @@ class rvPreProcessor():
 
         self.elf2hex_args = [elf2hex, '--bit-width', '64', '--input']
 
+        # Gates gcc on node memory, shared by all compile workers of the process
+        self.admission = admission or CompileAdmission()
+        # Test files in memfds, written to out/tests only when kept
+        self.in_memory = in_memory
+        # Per-iteration files that are not in memory go to the scratch space
+        self.scratch = scratch
+        self.toolchain = Toolchain(self.cc_args, self.elf2hex_args, self.admission)
+
     def debug_print(self, message):
         if self.debug:
             print(message)
@@ -80,6 +101,64 @@ class rvPreProcessor():
     #         for pc, code in zip(pc_list, codes):
     #             fout.write(f'{pc:016x}:{code:04b}\n')
 
+    def get_segments(self, test_template, num_data_sections):
+        """Template parsed into segments, read from disk only once"""
+        key = (test_template, num_data_sections)
+        with self.layout_lock:
+            if key not in self.segments:
+                with open(test_template, 'r') as fd:
+                    self.segments[key] = TemplateSegments(fd.readlines(), num_data_sections)
+            return self.segments[key]
+
+    def learn_layout(self, version, intr, extra_args, template_lines, data, num_data_sections):
+        """Build a probed reference test of the template and learn its symbol layout"""
+        (probed_lines, probes) = probe_template(template_lines)
+        (assembly, ref_sizes) = TemplateSegments(probed_lines, num_data_sections). \
+            render(['nop'], ['nop'], ['nop'], [0] * len(data))
+
+        if self.scratch is not None:
+            test_dir = self.scratch.path('tests')
+        else:
+            test_dir = os.path.join(self.base, 'tests')
+            os.makedirs(test_dir, exist_ok=True)
+        name = os.path.join(test_dir, '.layout_{}{}_{}'.format(templates[version],
+                                                               '_intr' if intr else '',
+                                                               self.proc_num))
+        with open(name + '.S', 'w') as fd:
+            fd.write(assembly)
+
+        cc_ret = self.admission.run(self.cc_args + extra_args + [name + '.S', '-o', name + '.elf'],
+                                    templates[version])
+        layout = None
+        if cc_ret == 0:
+            try:
+                layout = SymbolLayout.learn(name + '.elf', self.ld_name, probes, ref_sizes)
+            except (AssertionError, ValueError, OSError) as e:
+                print('[ProcessorFuzz] Symbol layout of {} not learned -- {}'.
+                      format(templates[version], e))
+
+        for ext in ['.S', '.elf']:
+            if os.path.isfile(name + ext):
+                os.remove(name + ext)
+        return layout
+
+    def layout_symbols(self, version, intr, extra_args, template_lines, data, num_data_sections, sizes):
+        """Symbol table computed from the learned layout, None if unavailable"""
+        if version == V_U:
+            # vm.c is built at -O2 with the test's ENTROPY, the size of its code (linked
+            # ahead of the test) depends on the value: V_U symbols come from the ELF
+            return None
+        key = (version, intr)
+        # process() may run on several compile workers at once
+        with self.layout_lock:
+            if key not in self.layouts:
+                self.layouts[key] = self.learn_layout(version, intr, extra_args, template_lines,
+                                                      data, num_data_sections)
+            layout = self.layouts[key]
+        if layout is None:
+            return None
+        return layout.compute(sizes)
+
     def process(self, sim_input: simInput, data: list, intr: bool, it, run_elf, num_data_sections=6):
         """Process input to generate test files, return inputs for ISA and RTL simulators"""
         section_size = len(data) // num_data_sections
@@ -112,15 +191,11 @@ class rvPreProcessor():
 
         # Generate output file paths (use os.path.join to ensure cross-platform compatibility)
         test_dir = os.path.join(self.base, 'tests')
-        os.makedirs(test_dir, exist_ok=True)  # Ensure directory exists
+        if not self.in_memory and self.scratch is None:
+            os.makedirs(test_dir, exist_ok=True)  # Ensure directory exists
 
-        si_name = os.path.join(test_dir, f'.input_{it}{sim_input.name_suffix}.si')
-        asm_name = os.path.join(test_dir, f'.input_{it}{sim_input.name_suffix}.S')
-        elf_name = os.path.join(test_dir, f'.input_{it}{sim_input.name_suffix}.elf')
-        hex_name = os.path.join(test_dir, f'.input_{it}{sim_input.name_suffix}.hex')
-        sym_name = os.path.join(test_dir, f'.input_{it}{sim_input.name_suffix}.symbols')
-        rtl_intr_name = os.path.join(test_dir, f'.input_{it}{sim_input.name_suffix}.rtl.intr')
-        isa_intr_name = os.path.join(test_dir, f'.input_{it}{sim_input.name_suffix}.isa.intr')
+        files = testFiles(test_dir, f'.input_{it}{sim_input.name_suffix}', self.in_memory,
+                          self.scratch)
 
         # Extract instructions and interrupt information from simulation input
         prefix_insts = sim_input.get_prefix()
@@ -138,76 +213,54 @@ class rvPreProcessor():
                 ints.append(INT)
 
         # Save simulation input
-        sim_input.save(si_name, data)
+        sim_input.save(files.path('.si'), data)
+
+        # Randomly insert fnmadd.s instruction with illegal frm field
+        suffix_lines = []
+        for inst in suffix_insts:
+            a = random.randint(0, 7)
+            if "fnmadd.s" in inst and a == 6:
+                suffix_lines.append('.word 0xa106e5cf')
+            suffix_lines.append(inst)
 
         # Generate assembly file
-        with open(test_template, 'r') as fd:
-            template_lines = fd.readlines()
-
-        assembly = []
-        for line in template_lines:
-            assembly.append(line)
-            # Insert prefix instructions
-            if '_fuzz_prefix:' in line:
-                for inst in prefix_insts:
-                    assembly.append(f'{inst};\n')
-            # Insert main instructions
-            if '_fuzz_main:' in line:
-                for inst in insts:
-                    assembly.append(f'{inst};\n')
-            # Insert suffix instructions (including randomized illegal patterns)
-            if '_fuzz_suffix:' in line:
-                for inst in suffix_insts:
-                    a = random.randint(0, 7)
-                    # Randomly insert fnmadd.s instruction with illegal frm field
-                    if "fnmadd.s" in inst and a == 6:
-                        assembly.append(".word 0xa106e5cf;\n")
-                    assembly.append(f'{inst};\n')
-            # Insert data sections
-            for n in range(num_data_sections):
-                start = n * section_size
-                end = start + section_size
-                if f'_random_data{n}' in line:
-                    k = 0
-                    for i in range(start, end, 2):
-                        label = ''
-                        if i > start + 2 and i < end - 4:
-                            label = f'd_{n}_{k}:'
-                            k += 1
-                        assembly.append(
-                            f'{label:<16}.dword 0x{data[i]:016x}, 0x{data[i+1]:016x}\n'
-                        )
-
-        with open(asm_name, 'w') as fd:
-            fd.writelines(assembly)
+        segments = self.get_segments(test_template, num_data_sections)
+        (assembly, sizes) = segments.render(prefix_insts, insts, suffix_lines, data)
 
         # Compile to generate ELF file
-        cc_args = self.cc_args + extra_args + [asm_name, '-o', elf_name]
-        cc_ret = -1
-
         if run_elf:
             # Directly copy existing ELF file
-            copyfile(run_elf, elf_name)
+            files.put('.S', assembly)
+            copyfile(run_elf, files.path('.elf'))
             cc_ret = 0
         else:
-            # Compile until success or non out-of-memory error
-            while True:
-                cc_ret = subprocess.call(cc_args)
-                if cc_ret != -9:  # -9 indicates OS terminated process due to out of memory
-                    break
+            # Admitted on memory, OOM kills are retried with backoff
+            cc_ret = self.toolchain.compile(assembly, extra_args, files, templates[version])
+            if cc_ret == -9:
+                print('[ProcessorFuzz] Compile of test {} OOM-killed, giving up'.format(it))
 
         # If compilation succeeds, generate subsequent files
         if cc_ret == 0:
             # Generate hex image
-            elf2hex_args = self.elf2hex_args + [elf_name, '--output', hex_name]
-            subprocess.call(elf2hex_args)
-            # Extract symbol table
-            symbols = self.get_symbols(elf_name, sym_name)
+            self.toolchain.elf2hex(files)
+            # Compute symbol table from the layout, nm is the fallback
+            symbols = None
+            if not run_elf:
+                symbols = self.layout_symbols(version, intr, extra_args, segments.lines,
+                                              data, num_data_sections, sizes)
+            if symbols is None or self.verify_layout:
+                nm_symbols = self.toolchain.symbols(files)
+                if symbols is not None:
+                    layout = self.layouts[(version, intr)]
+                    for (name, addr, nm_addr) in layout.verify(symbols, nm_symbols):
+                        print('[ProcessorFuzz] Symbol layout mismatch -- {}: {} (nm: {})'.
+                              format(name, hex(addr), None if nm_addr is None else hex(nm_addr)))
+                symbols = nm_symbols
 
             # Generate interrupt file (if needed)
             if intr:
                 fuzz_main = symbols['_fuzz_main']
-                with open(rtl_intr_name, 'w') as fd:
+                with open(files.path('.rtl.intr'), 'w') as fd:
                     for i, INT in enumerate(ints):
                         if INT:
                             fd.write(f'{fuzz_main + 4 * i:016x}:{INT:04b}\n')
@@ -220,9 +273,12 @@ class rvPreProcessor():
             # Instantiate simulator input objects
             from execution.isa_simulator import isaInput
             from execution.rtl_simulator import rtlInput
-            isa_input = isaInput(elf_name, isa_intr_name)
-            rtl_input = rtlInput(hex_name, rtl_intr_name, data, symbols, max_cycles)
+            isa_input = isaInput(files.path('.elf'), files.path('.isa.intr'), files)
+            rtl_input = rtlInput(files.path('.hex'), files.path('.rtl.intr'), data, symbols,
+                                 max_cycles, files)
         else:
+            # Broken tests are kept for inspection
+            files.keep()
             isa_input = None
             rtl_input = None
             symbols = None
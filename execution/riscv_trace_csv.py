@@ -20,12 +20,26 @@ import csv
 import re
 import logging
 import sys
+from itertools import islice
 from scripts.lib import *
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TRACE_FIELDS = ["pc", "instr", "gpr", "csr", "binary", "mode", "instr_str",
+                "operand", "pad", "mstatus", "frm", "fflags", "mcause", "scause", "medeleg",
+                "mcounteren", "scounteren"]
+
 
 class RiscvInstructionTraceEntry(object):
     """RISC-V instruction trace entry"""
 
+    __slots__ = ("gpr", "csr", "instr", "operand", "pc", "binary", "instr_str", "mode",
+                 "mstatus", "frm", "fflags", "mcause", "scause", "medeleg", "mcounteren",
+                 "scounteren", "dcsr")
+
     def __init__(self):
         self.gpr = []
         self.csr = []
@@ -43,13 +57,20 @@ class RiscvInstructionTraceEntry(object):
         self.medeleg = ""
         self.mcounteren = ""
         self.scounteren = ""
-        #self.dcsr = ""
+        self.dcsr = ""
 
     def get_trace_string(self):
         """Return a short string of the trace entry"""
         return ("pc[{}] {}: {} {}".format(
             self.pc, self.instr_str, " ".join(self.gpr), " ".join(self.csr)))
 
+    def row(self):
+        """CSV row of the entry, in TRACE_FIELDS order"""
+        return (self.pc, self.instr, ";".join(self.gpr), ";".join(self.csr), self.binary,
+                self.mode, self.instr_str, self.operand, "", self.mstatus, self.frm,
+                self.fflags, self.mcause, self.scause, self.medeleg, self.mcounteren,
+                self.scounteren)
+
 
 class RiscvInstructionTraceCsv(object):
     """RISC-V instruction trace CSV class
@@ -57,62 +78,67 @@ class RiscvInstructionTraceCsv(object):
     This class provides functions to read/write trace CSV
     """
 
-    def __init__(self, csv_fd):
+    def __init__(self, csv_fd, batch=1024):
         self.csv_fd = csv_fd
+        self.batch = batch
 
     def start_new_trace(self):
         """Create a CSV file handle for a new trace"""
-        fields = ["pc", "instr", "gpr", "csr", "binary", "mode", "instr_str",
-                  "operand", "pad", "mstatus", "frm", "fflags", "mcause", "scause", "medeleg", "mcounteren", "scounteren"]
-        self.csv_writer = csv.DictWriter(self.csv_fd, fieldnames=fields)
-        self.csv_writer.writeheader()
+        self.csv_writer = csv.writer(self.csv_fd)
+        self.csv_writer.writerow(TRACE_FIELDS)
+
+    def iter_rows(self):
+        """Yield each row of the CSV as a tuple in TRACE_FIELDS order"""
+        csv_reader = csv.reader(self.csv_fd)
+        header = next(csv_reader, None)
+        if header is None:
+            return
+        if header == TRACE_FIELDS:
+            for row in csv_reader:
+                yield tuple(row)
+        else:
+            order = [ header.index(field) if field in header else None
+                      for field in TRACE_FIELDS ]
+            for row in csv_reader:
+                yield tuple("" if n is None else row[n] for n in order)
+
+    def read_columns(self, as_numpy=False):
+        """Read the CSV into one list per field, NumPy string arrays if asked and available"""
+        rows = list(self.iter_rows())
+        columns = {}
+        for (n, field) in enumerate(TRACE_FIELDS):
+            column = [ row[n] for row in rows ]
+            columns[field] = np.array(column) if as_numpy and np is not None else column
+        return columns
 
     def read_trace(self, trace):
         """Read instruction trace from CSV file"""
-        csv_reader = csv.DictReader(self.csv_fd)
-        for row in csv_reader:
+        for row in self.iter_rows():
             new_trace = RiscvInstructionTraceEntry()
-            new_trace.gpr = row['gpr'].split(';')
-            new_trace.csr = row['csr'].split(';')
-            new_trace.pc = row['pc']
-            new_trace.operand = row['operand']
-            new_trace.binary = row['binary']
-            new_trace.instr_str = row['instr_str']
-            new_trace.instr = row['instr']
-            new_trace.mode = row['mode']
-            new_trace.mstatus = row['mstatus']
-            new_trace.frm = row['frm']
-            new_trace.fflags = row['fflags']
-            new_trace.mcause = row['mcause']
-            new_trace.scause = row['scause']
-            new_trace.medeleg = row['medeleg']
-            new_trace.mcounteren = row['mcounteren']
-            new_trace.scounteren = row['scounteren']
-            #new_trace.dcsr = row['dcsr']
+            (new_trace.pc, new_trace.instr, gpr, csr, new_trace.binary, new_trace.mode,
+             new_trace.instr_str, new_trace.operand, _, new_trace.mstatus, new_trace.frm,
+             new_trace.fflags, new_trace.mcause, new_trace.scause, new_trace.medeleg,
+             new_trace.mcounteren, new_trace.scounteren) = row
+            new_trace.gpr = gpr.split(';')
+            new_trace.csr = csr.split(';')
             trace.append(new_trace)
 
     # TODO: Convert pseudo instruction to regular instruction
 
     def write_trace_entry(self, entry):
         """Write a new trace entry to CSV"""
-        self.csv_writer.writerow({'instr_str': entry.instr_str,
-                                  'gpr'      : ";".join(entry.gpr),
-                                  'csr'      : ";".join(entry.csr),
-                                  'operand'  : entry.operand,
-                                  'pc'       : entry.pc,
-                                  'binary'   : entry.binary,
-                                  'instr'    : entry.instr,
-                                  'mode'     : entry.mode,
-                                  'mstatus'  : entry.mstatus,
-                                  'frm'  : entry.frm,
-                                  'fflags'   : entry.fflags,
-                                  'mcause'   : entry.mcause,
-                                  'scause'   : entry.scause,
-                                  'medeleg'   : entry.medeleg,
-                                  'mcounteren'   : entry.mcounteren,
-                                  'scounteren'   : entry.scounteren
-                                  #'dcsr'   : entry.dcsr
-                                  })
+        self.csv_writer.writerow(entry.row())
+
+    def write_trace_entries(self, entries):
+        """Write trace entries to CSV in batches, return how many were written"""
+        entries = iter(entries)
+        count = 0
+        while True:
+            rows = [ entry.row() for entry in islice(entries, self.batch) ]
+            if not rows:
+                return count
+            self.csv_writer.writerows(rows)
+            count += len(rows)
 
 
 def get_imm_hex_val(imm):
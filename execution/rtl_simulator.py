@@ -184,9 +184,10 @@ class RTL_Simulator:
         return self.dut.io_covSum.value & cov_mask
 
 class rtlInput:
-    def __init__(self, hexfile, intrfile, data, symbols, max_cycles):
+    def __init__(self, hexfile, intrfile, data, symbols, max_cycles, files=None):
         self.hexfile = hexfile    # Hex mirror path
         self.intrfile = intrfile  # Interrupt file path
         self.data = data          # Data Segmentation
         self.symbols = symbols    # Symbol Table (Address)
-        self.max_cycles = max_cycles  # Max Simulation cycle
\ No newline at end of file
+        self.max_cycles = max_cycles  # Max Simulation cycle
+        self.files = files        # testFiles backing the paths
\ No newline at end of file
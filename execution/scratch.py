@@ -0,0 +1,81 @@
+""" Scratch space
+Per-iteration files (traces, logs, tests that are not kept) go to a scratch
+directory on a RAM-backed filesystem instead of the durable output directory.
+Deleting them is handed to a background thread that unlinks in batches, so
+the simulation loop never waits on unlink. Files worth keeping are copied to
+the output directory with keep().
+"""
+
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+def default_scratch_root():
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+class ScratchSpace():
+    def __init__(self, root=None, name='processorfuzz', proc_num=0, batch=64, interval=1.0):
+        root = root or default_scratch_root()
+        self.dir = os.path.join(root, '{}_{}_{}'.format(name, os.getpid(), proc_num))
+        for sub in ['tests', 'trace']:
+            os.makedirs(os.path.join(self.dir, sub), exist_ok=True)
+
+        self.batch = batch
+        self.interval = interval
+        self.pending = queue.Queue()
+        self.removed = 0
+        self.cleaner = threading.Thread(target=self._clean, name='scratch-cleaner',
+                                        daemon=True)
+        self.cleaner.start()
+
+    def path(self, *parts):
+        return os.path.join(self.dir, *parts)
+
+    def discard(self, *paths):
+        """Schedule files for deletion by the cleaner"""
+        for path in paths:
+            self.pending.put(path)
+
+    def keep(self, path, dest_dir):
+        """Copy a scratch file to a durable directory, return the copy"""
+        os.makedirs(dest_dir, exist_ok=True)
+        dest = os.path.join(dest_dir, os.path.basename(path))
+        shutil.copyfile(path, dest)
+        return dest
+
+    def _unlink(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+                self.removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print('[ProcessorFuzz] Scratch cleaner could not remove {} -- {}'.format(path, e))
+
+    def _clean(self):
+        stop = False
+        while not stop:
+            paths = []
+            try:
+                paths.append(self.pending.get(timeout=self.interval))
+                while len(paths) < self.batch:
+                    paths.append(self.pending.get_nowait())
+            except queue.Empty:
+                pass
+
+            if None in paths:
+                stop = True
+                paths = [ path for path in paths if path is not None ]
+            self._unlink(paths)
+
+    def close(self):
+        """Drain the cleaner and remove the scratch directory"""
+        self.pending.put(None)
+        self.cleaner.join()
+        shutil.rmtree(self.dir, ignore_errors=True)
@@ -26,6 +26,7 @@ sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
 
 from riscv_trace_csv import *
 from scripts.lib import *
+from common.compression import open_trace
 
 RD_RE    = re.compile(r"core .*(?P<pri>\d) 0x(?P<addr>[a-f0-9]+?) \((?P<bin>.*?)\).* (?P<reg>[xf]\s*\d*?) 0x(?P<val>[a-f0-9]+)")
 CORE_RE  = re.compile(r"core.*0x(?P<addr>[a-f0-9]+?) \(0x(?P<bin>.*?)\) \[0x(?P<mstatus>[a-f0-9]+?),(?P<frm>[a-f0-9]+?),(?P<fflags>[a-f0-9]+?),(?P<mcause>[a-f0-9]+?),(?P<scause>[a-f0-9]+?),(?P<medeleg>[a-f0-9]+?),(?P<mcounteren>[a-f0-9]+?),(?P<scounteren>[a-f0-9]+?),(?P<dcsr>[a-f0-9]+?)\] (?P<instr>.*?)$")
@@ -128,94 +129,105 @@ def read_spike_trace(path, full_trace):
   # true. Otherwise, we are in state EFFECT if instr is not None, otherwise we
   # are in state INSTR.
 
-  end_trampoline_re = re.compile(r'core.*: 0x0*1010 ') #chath: changed 0x0*1010 -> 0x0*10010 to match correctly
+  with open_trace(path, 'r') as handle:
+    yield from read_spike_lines(handle, full_trace)
 
-  in_trampoline = True
-  instr = None
 
-  with open(path, 'r') as handle:
-    for line in handle:
-      #print("T-1")
-      if in_trampoline:
-        # The TRAMPOLINE state
-        #print("trampo")
-        if end_trampoline_re.match(line):
-          in_trampoline = False
-        continue
+def read_spike_lines(lines, full_trace):
+  '''Same as read_spike_trace, on an iterable of log lines.
 
-      if instr is None:
-        # The INSTR state. We expect to see a line matching CORE_RE. We'll
-        # discard any other lines.
-        instr_match = CORE_RE.match(line)
-        #print("matched0")
-        if not instr_match:
-          continue
-        instr = read_spike_instr(instr_match, full_trace)
-        #print("matched",instr.instr_str)
-        # If instr.instr_str is 'ecall', we should stop.
-        if instr.instr_str == 'ecall':
-          break
+  The lines may come from a pipe while Spike is still running. Iteration stops
+  at the end-of-test ECALL, without reading the rest of the log.
 
-        continue
+  '''
 
-      # The EFFECT state. If the line matches CORE_RE, we should have been in
-      # state INSTR, so we yield the instruction we had, read the new
-      # instruction and continue. As above, if the new instruction is 'ecall',
-      # we need to stop immediately.
-      instr_match = CORE_RE.match(line)
-      if instr_match:
-        #print("matched1",instr.instr_str)
-        yield (instr, False)
-        instr = read_spike_instr(instr_match, full_trace)
-        if instr.instr_str == 'ecall':
-          break
-        continue
+  end_trampoline_re = re.compile(r'core.*: 0x0*1010 ') #chath: changed 0x0*1010 -> 0x0*10010 to match correctly
 
-      # The line doesn't match CORE_RE, so we are definitely on a follow-on
-      # line in the log. First, check for illegal instructions
-      if 'trap_illegal_instruction' in line:
-        yield (instr, True)
-        instr = None
-        continue
+  in_trampoline = True
+  instr = None
 
-      # The instruction seems to have been fine. Do we have commit data (from
-      # the --log-commits Spike option)?
-      #print("commit reached")
-      #print(line)
-      commit_match = RD_RE.match(line)
-      if commit_match:
-        #print("commit match")
-        instr.gpr.append(gpr_to_abi(commit_match.group('reg')
-                                    .replace(' ', '')) +
-                         ':' + commit_match.group('val'))
-        instr.mode = commit_match.group('pri')
-      
-      
-      store_match = MEM_RE.match(line)
-      if store_match:
-        #instr.gpr.append(store_match.group('store_addr') + ':' + store_match.group('val'))
-        instr.mode = store_match.group('pri')
-      #'''
-      csr_match = CSR_RE.match(line)
-      if csr_match:
-        instr.gpr.append(csr_match.group('csr') + ':' + csr_match.group('val'))
-        instr.mode = csr_match.group('pri')
-        #instr.csr = csr_match.group('csr')
-      #'''
-      other_match = OTHER_RE.match(line)
-      if other_match:
-        #print("Other matched ",line)
-        #instr.gpr.append(other_match.group('csr') + ':' + csr_match.group('val'))
-        #print("TESTO ",other_match.group('addr'))
-        instr.mode = other_match.group('pri')
-        #instr.pc = other_match.group('addr')
-        #instr.binary = other_match.group('bin')
-        #instr.mstatus = match.group('mstatus')
-        #instr.fflags = match.group('fflags')
-    #'''
-    # At EOF, we might have an instruction in hand. Yield it if so.
-    if instr is not None:
+  for line in lines:
+    #print("T-1")
+    if in_trampoline:
+      # The TRAMPOLINE state
+      #print("trampo")
+      if end_trampoline_re.match(line):
+        in_trampoline = False
+      continue
+
+    if instr is None:
+      # The INSTR state. We expect to see a line matching CORE_RE. We'll
+      # discard any other lines.
+      instr_match = CORE_RE.match(line)
+      #print("matched0")
+      if not instr_match:
+        continue
+      instr = read_spike_instr(instr_match, full_trace)
+      #print("matched",instr.instr_str)
+      # If instr.instr_str is 'ecall', we should stop.
+      if instr.instr_str == 'ecall':
+        break
+
+      continue
+
+    # The EFFECT state. If the line matches CORE_RE, we should have been in
+    # state INSTR, so we yield the instruction we had, read the new
+    # instruction and continue. As above, if the new instruction is 'ecall',
+    # we need to stop immediately.
+    instr_match = CORE_RE.match(line)
+    if instr_match:
+      #print("matched1",instr.instr_str)
       yield (instr, False)
+      instr = read_spike_instr(instr_match, full_trace)
+      if instr.instr_str == 'ecall':
+        break
+      continue
+
+    # The line doesn't match CORE_RE, so we are definitely on a follow-on
+    # line in the log. First, check for illegal instructions
+    if 'trap_illegal_instruction' in line:
+      yield (instr, True)
+      instr = None
+      continue
+
+    # The instruction seems to have been fine. Do we have commit data (from
+    # the --log-commits Spike option)?
+    #print("commit reached")
+    #print(line)
+    commit_match = RD_RE.match(line)
+    if commit_match:
+      #print("commit match")
+      instr.gpr.append(gpr_to_abi(commit_match.group('reg')
+                                  .replace(' ', '')) +
+                       ':' + commit_match.group('val'))
+      instr.mode = commit_match.group('pri')
+    
+    
+    store_match = MEM_RE.match(line)
+    if store_match:
+      #instr.gpr.append(store_match.group('store_addr') + ':' + store_match.group('val'))
+      instr.mode = store_match.group('pri')
+    #'''
+    csr_match = CSR_RE.match(line)
+    if csr_match:
+      instr.gpr.append(csr_match.group('csr') + ':' + csr_match.group('val'))
+      instr.mode = csr_match.group('pri')
+      #instr.csr = csr_match.group('csr')
+    #'''
+    other_match = OTHER_RE.match(line)
+    if other_match:
+      #print("Other matched ",line)
+      #instr.gpr.append(other_match.group('csr') + ':' + csr_match.group('val'))
+      #print("TESTO ",other_match.group('addr'))
+      instr.mode = other_match.group('pri')
+      #instr.pc = other_match.group('addr')
+      #instr.binary = other_match.group('bin')
+      #instr.mstatus = match.group('mstatus')
+      #instr.fflags = match.group('fflags')
+  #'''
+  # At EOF, we might have an instruction in hand. Yield it if so.
+  if instr is not None:
+    yield (instr, False)
 
 
 def process_spike_sim_log(spike_log, csv, full_trace = 1):
@@ -223,19 +235,17 @@ def process_spike_sim_log(spike_log, csv, full_trace = 1):
 
   Extract instruction and affected register information from spike simulation
   log and write the results to a CSV file at csv. Returns the number of
-  instructions written.
+  instructions written. spike_log is a path, or an iterable of log lines such
+  as a pipe from a running Spike.
 
   """
   #print("#################TEST0")
   logging.info("Processing spike log : %s" % spike_log)
   instrs_in = 0
-  instrs_out = 0
 
-  with open(csv, "w") as csv_fd:
-    trace_csv = RiscvInstructionTraceCsv(csv_fd)
-    trace_csv.start_new_trace()
-    #print("#################TEST1")
-    for (entry, illegal) in read_spike_trace(spike_log, full_trace):
+  def kept(entries):
+    nonlocal instrs_in
+    for (entry, illegal) in entries:
       instrs_in += 1
       #print("#################TEST2", entry.instr_str, entry.gpr)
       if illegal and full_trace:
@@ -252,8 +262,18 @@ def process_spike_sim_log(spike_log, csv, full_trace = 1):
         #print("TEST3")
         continue
       #print("TEST4")
-      trace_csv.write_trace_entry(entry)
-      instrs_out += 1
+      yield entry
+
+  with open_trace(csv, "w") as csv_fd:
+    trace_csv = RiscvInstructionTraceCsv(csv_fd)
+    trace_csv.start_new_trace()
+    #print("#################TEST1")
+    if isinstance(spike_log, str):
+      entries = read_spike_trace(spike_log, full_trace)
+    else:
+      entries = read_spike_lines(spike_log, full_trace)
+    # Rows are written in batches
+    instrs_out = trace_csv.write_trace_entries(kept(entries))
 
   logging.info("Processed instruction count : %d" % instrs_in)
   logging.info("CSV saved to : %s" % csv)
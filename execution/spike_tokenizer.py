@@ -0,0 +1,120 @@
+""" Spike tokenizer
+Splits the two line shapes Spike (-l --log-commits) emits at fixed positions
+instead of running CORE_RE, RD_RE, MEM_RE, CSR_RE and OTHER_RE on them:
+
+  core   0: 0x<pc> (0x<bin>) [0x<mstatus>,<frm>,...,<dcsr>] <disasm>
+  core   0: <pri> 0x<pc> (0x<bin>) [x<n> 0x<val>|x <n> 0x<val>|c<n>_<csr> 0x<val>|mem 0x<a> 0x<v>]...
+
+Both functions return None whenever a line is not exactly in the expected
+shape, the caller then uses the regexes. When they do return, the result is
+the one the regexes give for that line.
+"""
+
+HEX = '0123456789abcdef'
+DIGITS = '0123456789'
+CSR_CHARS = 'abcdefghijklmnopqrstuvwxyz0123456789'
+
+NUM_CORE_CSRS = 9
+
+def is_hex(s):
+    return s != '' and not s.strip(HEX)
+
+def hex_prefix(s):
+    """Longest leading run of hex digits"""
+    n = len(s) - len(s.lstrip(HEX))
+    return s[:n]
+
+def split_core(line):
+    """(pc, addr, binary, csrs, instr, disasm, vector) of a commit line, or None
+
+    pc, csrs and instr are what extract_transitions splits out of the line
+    (pc with 0x, raw CSR strings, text after the bracket), addr, binary and
+    disasm are the CORE_RE groups addr, bin and instr. vector is the bracket
+    text the CSRs were split from.
+    """
+    if not line.startswith('core') or '\n' in line[:-1]:
+        return None
+    p = line.find(' (0x')
+    if p < 0 or line.find(' (0x', p + 4) >= 0:
+        return None
+    q = line.rfind(' 0x', 0, p) + 1
+    if q <= 0 or len(line[:q].split()) != 2:
+        return None
+    addr = line[q + 2:p]
+    r = line.find(') [0x', p + 4)
+    if not is_hex(addr) or r < 0 or line.find('[') != r + 2:
+        return None
+    binary = line[p + 4:r]
+    e = line.find(']', r + 5)
+    if e < 0 or line[e + 1:e + 2] != ' ':
+        return None
+    vector = line[r + 3:e]
+    csrs = vector.split(',')
+    if len(csrs) != NUM_CORE_CSRS or not is_hex(csrs[0][2:]) or \
+       not all(is_hex(val) for val in csrs[1:]):
+        return None
+    tail = line[e + 2:]
+    if ']' in tail:
+        return None
+    disasm = tail[:-1] if tail.endswith('\n') else tail
+    return (line[q:p], addr, binary, csrs, line[e + 1:].rstrip(), disasm, vector)
+
+def split_effect(line):
+    """(pri, rd, csr) of a follow-on line, or None
+
+    rd is the (register, value) RD_RE captures, csr the (csr, value) of
+    CSR_RE, each None when that regex does not match. pri is the privilege
+    the matching regexes report, None if none of RD, MEM, CSR and OTHER match.
+    """
+    if not line.startswith('core ') or '[' in line or '\n' in line[:-1]:
+        return None
+    c = line.find(': ')
+    if c < 0:
+        return None
+    tail = line[c + 2:]
+    if tail.endswith('\n'):
+        tail = tail[:-1]
+    parts = tail.split(' ')
+    if len(parts) < 3 or '' in parts or tail.count('(') != 1 or tail.count(')') != 1:
+        return None
+    (pri, addr, binary) = parts[:3]
+    if len(pri) != 1 or pri not in DIGITS or not addr.startswith('0x') or \
+       not is_hex(addr[2:]) or not binary.startswith('(') or not binary.endswith(')'):
+        return None
+
+    rest = parts[3:]
+    if not rest:
+        # OTHER_RE: nothing after the binary
+        return (pri, None, None)
+
+    matched = False
+    if rest[0] == 'mem' and len(rest) >= 3 and rest[1].startswith('0x') and \
+       is_hex(rest[1][2:]) and rest[2].startswith('0x') and hex_prefix(rest[2][2:]):
+        matched = True
+
+    csr = None
+    tok = rest[0]
+    u = tok.find('_')
+    if len(rest) >= 2 and tok.startswith('c') and u > 1 and not tok[1:u].strip(DIGITS) and \
+       tok[u + 1:] and not tok[u + 1:].strip(CSR_CHARS) and rest[1].startswith('0x') and \
+       hex_prefix(rest[1][2:]):
+        csr = (tok[u + 1:], hex_prefix(rest[1][2:]))
+        matched = True
+
+    rd = None
+    for i in range(len(rest) - 2, -1, -1):
+        tok = rest[i]
+        if tok[0] not in 'xf' or tok[1:].strip(DIGITS):
+            continue
+        if rest[i + 1].startswith('0x') and hex_prefix(rest[i + 1][2:]):
+            rd = (tok, hex_prefix(rest[i + 1][2:]))
+        elif tok in 'xf' and i + 2 < len(rest) and not rest[i + 1].strip(DIGITS) and \
+             rest[i + 2].startswith('0x') and hex_prefix(rest[i + 2][2:]):
+            # Registers below 10 are printed padded, "x 5 0x..."
+            rd = (tok + rest[i + 1], hex_prefix(rest[i + 2][2:]))
+        else:
+            continue
+        matched = True
+        break
+
+    return (pri if matched else None, rd, csr)
@@ -0,0 +1,254 @@
+""" Symbol layout
+The symbols the harness reads from a generated test (_fuzz_main, _end_main,
+begin_signature, tohost, _random_dataN/_end_dataN, reg_xN_output, CSR output
+slots, ...) only depend on the template and on the byte size of the parts
+rvPreProcessor inserts into it. A layout is learned once per template from a
+reference build, and the symbol table of every later test is computed from
+the encoded sizes of its fuzz bodies instead of running nm on its ELF.
+"""
+
+import re
+import struct
+
+SYMBOL  = 0
+INSERT  = 1
+BARRIER = 2
+
+SHF_ALLOC  = 0x2
+SHT_SYMTAB = 2
+SHN_UNDEF  = 0
+SHN_LORESERVE = 0xff00
+STT_SECTION = 3
+STT_FILE    = 4
+
+PROBE = '_layout_probe'
+
+# Conditional branches only reach +-4KiB, gas relaxes the ones that do not
+# fit into two instructions. Bodies larger than this are left to nm.
+BRANCH_RANGE = 4096
+
+ALIGN_RE  = re.compile(r'^\s*\.(p2)?align\b\s*(\d*)')
+LABEL_RE  = re.compile(r'^\s*([A-Za-z_.$][\w.$]*)\s*:')
+BODY_RE   = re.compile(r'^(_[pls]\d+|d_\d+_\d+|' + PROBE + r'\d+)$')
+LD_RE     = re.compile(r'ALIGN\s*\(\s*(0x[0-9a-fA-F]+|\d+)\s*\)|^\s*(\.[\w.]+)\s*:', re.M)
+
+def align_up(addr, align):
+    if align <= 1:
+        return addr
+    return (addr + align - 1) // align * align
+
+def inst_bytes(inst):
+    """Encoded size of one fuzz instruction line, None if it can not be told"""
+    label = LABEL_RE.match(inst)
+    if label:
+        inst = inst[label.end():]
+    tokens = inst.replace(',', ' ').split()
+    if not tokens:
+        return 0
+
+    opcode = tokens[0]
+    if opcode in [ 'la', 'lla' ]:
+        return 8
+    if opcode == 'li':
+        try: imm = int(tokens[2], 0)
+        except (IndexError, ValueError): return None
+        return 4 if -2048 <= imm < 2048 else None
+    if opcode in [ 'call', 'tail' ]:
+        # Subject to linker relaxation
+        return None
+    return 4
+
+def body_bytes(insts):
+    size = 0
+    for inst in insts:
+        n = inst_bytes(inst)
+        if n is None:
+            return None
+        size += n
+    return size
+
+def read_elf(elf_name):
+    """Return (sections, symbols) of a little endian ELF64 file
+
+    sections: list of (index, name, addr, size, align) for allocated sections
+    symbols:  dict name -> (addr, section index)
+    """
+    with open(elf_name, 'rb') as fd:
+        elf = fd.read()
+
+    assert elf[:4] == b'\x7fELF' and elf[4] == 2 and elf[5] == 1, \
+        '{} is not a little endian ELF64 file'.format(elf_name)
+
+    (shoff,) = struct.unpack_from('<Q', elf, 0x28)
+    (shentsize, shnum, shstrndx) = struct.unpack_from('<HHH', elf, 0x3a)
+
+    headers = [ struct.unpack_from('<IIQQQQIIQQ', elf, shoff + i * shentsize)
+                for i in range(shnum) ]
+
+    def cstr(offset):
+        return elf[offset:elf.index(b'\x00', offset)].decode()
+
+    shstr = headers[shstrndx][4]
+    sections = []
+    symbols = {}
+    for (i, hdr) in enumerate(headers):
+        (name, tpe, flags, addr, offset, size, link, info, align, entsize) = hdr
+        if flags & SHF_ALLOC and addr:
+            sections.append((i, cstr(shstr + name), addr, size, max(align, 1)))
+
+        if tpe == SHT_SYMTAB:
+            strtab = headers[link][4]
+            for off in range(offset + entsize, offset + size, entsize):
+                (st_name, st_info, st_other, st_shndx, st_value, st_size) = \
+                    struct.unpack_from('<IBBHQQ', elf, off)
+                if st_shndx == SHN_UNDEF or (st_info & 0xf) in [ STT_SECTION, STT_FILE ]:
+                    continue
+                symbols[cstr(strtab + st_name)] = (st_value, st_shndx)
+
+    sections.sort(key=lambda sec: sec[2])
+    return (sections, symbols)
+
+def read_ld_aligns(ld_name):
+    """Map output section name -> ALIGN() that precedes it in a linker script"""
+    with open(ld_name, 'r') as fd:
+        script = fd.read()
+
+    aligns = {}
+    pending = 1
+    for match in LD_RE.finditer(script):
+        if match.group(1):
+            pending = int(match.group(1), 0)
+        else:
+            aligns[match.group(2)] = pending
+            pending = 1
+    return aligns
+
+def probe_template(template_lines):
+    """Insert a probe label in front of every .align of the template
+
+    Returns (lines, probes), probes maps a probe name to
+    (alignment, labels that are defined right before the .align).
+    """
+    lines = []
+    probes = {}
+    pending = []
+    continued = False
+    for line in template_lines:
+        align = ALIGN_RE.match(line)
+        if align and not continued:
+            name = PROBE + str(len(probes))
+            # On RISC-V, .align n aligns to 2^n bytes
+            n = int(align.group(2)) if align.group(2) else 2
+            probes[name] = (1 << n, pending)
+            pending = []
+            lines.append('{}:\n'.format(name))
+        else:
+            label = LABEL_RE.match(line)
+            rest = line[label.end():] if label else line
+            if rest.strip() and not rest.lstrip().startswith(('#', '//', '/*')):
+                pending = []
+            elif label:
+                pending = pending + [ label.group(1) ]
+        continued = line.rstrip().endswith('\\')
+        lines.append(line)
+    return (lines, probes)
+
+
+class SymbolLayout():
+    def __init__(self, sections, ref_sizes):
+        # sections: list of (ref_start, ref_end, align, pinned, events)
+        self.sections = sections
+        self.ref_sizes = ref_sizes
+
+    @classmethod
+    def learn(cls, elf_name, ld_name, probes, ref_sizes):
+        """Learn the layout from a probed reference build
+
+        ref_sizes maps each insertion marker (the label that ends the
+        template line the body is inserted after) to its size in the build.
+        """
+        (sections, symbols) = read_elf(elf_name)
+        ld_aligns = read_ld_aligns(ld_name)
+
+        index = {}
+        layout = []
+        prev_end = None
+        for (i, name, addr, size, align) in sections:
+            align = max(align, ld_aligns.get(name, 1))
+            pinned = prev_end is None or align_up(prev_end, align) != addr
+            index[i] = len(layout)
+            layout.append((addr, addr + size, align, pinned, []))
+            prev_end = addr + size
+
+        for (name, (addr, shndx)) in symbols.items():
+            if shndx in index:
+                sec = index[shndx]
+            elif shndx >= SHN_LORESERVE:
+                # Linker script symbols such as _end
+                secs = [ n for (n, s) in enumerate(layout) if s[0] <= addr <= s[1] ]
+                if not secs:
+                    continue
+                sec = secs[-1]
+            else:
+                continue
+
+            events = layout[sec][4]
+            if name in probes:
+                (align, pre_labels) = probes[name]
+                events.append((addr, 2, BARRIER, name, align))
+            elif name in ref_sizes:
+                events.append((addr, 3, SYMBOL, name, None))
+                events.append((addr + ref_sizes[name], 0, INSERT, name, ref_sizes[name]))
+            elif not BODY_RE.match(name):
+                pre = any(name in pre_labels for (align, pre_labels) in probes.values())
+                events.append((addr, 1 if pre else 3, SYMBOL, name, None))
+
+        # At equal addresses: end of an insertion, labels written before an
+        # .align, the alignment itself, then everything else
+        for sec in layout:
+            sec[4].sort(key=lambda event: event[:2])
+
+        missing = [ name for name in ref_sizes if name not in symbols ]
+        assert not missing, 'Insertion markers {} are not in {}'.format(missing, elf_name)
+
+        return cls(layout, dict(ref_sizes))
+
+    def compute(self, sizes):
+        """Symbol table of a test whose insertions have the given byte sizes
+
+        Returns None when the sizes can not be handled analytically.
+        """
+        for (name, size) in sizes.items():
+            if size is None or (not name.startswith('_random_data') and size > BRANCH_RANGE):
+                return None
+
+        symbols = {}
+        prev_end = None
+        for (ref_start, ref_end, align, pinned, events) in self.sections:
+            if pinned:
+                if prev_end is not None and prev_end > ref_start:
+                    return None
+                start = ref_start
+            else:
+                start = align_up(prev_end, align)
+            shift = start - ref_start
+
+            for (addr, order, kind, name, val) in events:
+                if kind == SYMBOL:
+                    symbols[name] = addr + shift
+                elif kind == INSERT:
+                    shift += sizes.get(name, val) - val
+                else: # BARRIER
+                    shift = align_up(addr + shift, val) - align_up(addr, val)
+
+            prev_end = ref_end + shift
+        return symbols
+
+    def verify(self, computed, nm_symbols):
+        """Differences between a computed table and the symbols read by nm"""
+        diffs = []
+        for (name, addr) in computed.items():
+            nm_addr = nm_symbols.get(name)
+            if nm_addr != addr:
+                diffs.append((name, addr, nm_addr))
+        return diffs
@@ -0,0 +1,92 @@
+""" Template segments
+A test template is parsed once into static text segments separated by typed
+insertion points. Rendering a test is then a single join of the segments with
+the fuzz bodies and the data sections, the latter formatted in bulk from a
+per-section format string that is built once per section size.
+"""
+
+from execution.symbol_layout import body_bytes
+
+PREFIX = 0
+MAIN   = 1
+SUFFIX = 2
+DATA   = 3
+
+MARKERS = [ (PREFIX, '_fuzz_prefix:', '_fuzz_prefix'),
+            (MAIN,   '_fuzz_main:',   '_fuzz_main'),
+            (SUFFIX, '_fuzz_suffix:', '_fuzz_suffix') ]
+
+DATA_MARKER = '_random_data{}'
+
+def data_format(n, section_size):
+    """printf format of data section n, two dwords per line
+
+    Pairs other than the first two and the last two are labelled d_n_k
+    so that fuzz instructions can address them.
+    """
+    lines = []
+    k = 0
+    for i in range(0, section_size, 2):
+        label = ''
+        if 2 < i < section_size - 4:
+            label = 'd_{}_{}:'.format(n, k)
+            k += 1
+        lines.append('{:<16}.dword 0x%016x, 0x%016x\n'.format(label))
+    return ''.join(lines)
+
+def render_body(insts):
+    if not insts:
+        return ''
+    return ';\n'.join(insts) + ';\n'
+
+
+class TemplateSegments():
+    def __init__(self, template_lines, num_data_sections=6):
+        self.lines = template_lines
+        self.num_data_sections = num_data_sections
+
+        # segments[i] is followed by points[i], the last segment by nothing
+        self.segments = []
+        self.points = []
+        self.formats = {}
+
+        chunk = []
+        for line in template_lines:
+            chunk.append(line)
+            points = [ (kind, name) for (kind, marker, name) in MARKERS if marker in line ]
+            points += [ (DATA, n) for n in range(num_data_sections)
+                        if DATA_MARKER.format(n) in line ]
+            for point in points:
+                self.segments.append(''.join(chunk))
+                self.points.append(point)
+                chunk = []
+        self.segments.append(''.join(chunk))
+
+    def data_format(self, n, section_size):
+        key = (n, section_size)
+        if key not in self.formats:
+            self.formats[key] = data_format(n, section_size)
+        return self.formats[key]
+
+    def render(self, prefix_insts, insts, suffix_insts, data):
+        """Fill the template, return (assembly, byte size of each insertion)"""
+        section_size = len(data) // self.num_data_sections
+        bodies = { '_fuzz_prefix': prefix_insts,
+                   '_fuzz_main':   insts,
+                   '_fuzz_suffix': suffix_insts }
+
+        parts = []
+        sizes = {}
+        for (segment, (kind, arg)) in zip(self.segments, self.points):
+            parts.append(segment)
+            if kind == DATA:
+                start = arg * section_size
+                parts.append(self.data_format(arg, section_size) %
+                             tuple(data[start:start + section_size]))
+                sizes[DATA_MARKER.format(arg)] = 8 * section_size
+            else:
+                parts.append(render_body(bodies[arg]))
+                sizes[arg] = body_bytes(bodies[arg])
+        parts.append(self.segments[-1])
+
+        return (''.join(parts), sizes)
@@ -1,41 +1,127 @@
+import os
 from cocotb.decorators import coroutine
 
 from execution.isa_simulator import ISA_Simulator
+from execution.isa_pool import IsaPool
+from execution.isa_cache import IsaCache
+from execution.isa_tiers import TierPolicy
+from execution.isa_timeouts import IsaTimeouts
+from execution.path_store import PathStore
+from mutation.mutator import templates
 from execution.rtl_simulator import RTL_Simulator
-from execution.trace_compare import trace_compare
+from common.utils import trace_compare
 from execution.preprocessor import rvPreProcessor
+from execution.scratch import ScratchSpace
 from execution.signature_checker import SignatureChecker
 from common.constants import SUCCESS
+from common.compression import record_path
+
+CC = 'riscv64-unknown-elf-gcc'
+ELF2HEX = 'riscv64-unknown-elf-elf2hex'
 
 class TestExecutor:
-    def __init__(self, dut, toplevel, out_dir, debug=False):
-        self.preprocessor = rvPreProcessor(...)  # Init with env parser
+    def __init__(self, dut, toplevel, out_dir, debug=False, template='Template', proc_num=0,
+                 scratch_root=None, isa_workers=2, isa_cache_dir=None, isa_cache_mb=1024,
+                 path_capacity=1 << 20):
+        # Per-iteration files live in RAM, out_dir only receives kept results
+        self.scratch = ScratchSpace(scratch_root, proc_num=proc_num)
+        self.preprocessor = rvPreProcessor(CC, ELF2HEX, template, out_dir, proc_num,
+                                           in_memory=True, scratch=self.scratch)
         self.checker = SignatureChecker(toplevel)
         self.dut = dut
         self.toplevel = toplevel
         self.out_dir = out_dir
         self.debug = debug
-        self.isa_sim = ISA_Simulator(debug=debug)
+        # Spike results are reused across iterations and workers of the node
+        self.isa_cache = IsaCache(isa_cache_dir, isa_cache_mb) if isa_cache_mb > 0 else None
+        self.isa_sim = ISA_Simulator(debug=debug, cache=self.isa_cache)
+        # Spike screens without --log-commits when that is cheaper overall
+        self.tiers = TierPolicy()
+        # Spike time limits follow each template's observed run times
+        self.isa_timeouts = IsaTimeouts(default=self.isa_sim.timeout)
+        self.isa_pool = IsaPool(self.isa_sim, self.scratch.dir, num_workers=isa_workers,
+                                tiers=self.tiers, timeouts=self.isa_timeouts)
         self.rtl_sim = RTL_Simulator(dut, toplevel, debug=debug)
+        # RTL only runs paths no worker of the node compared yet on this RTL build
+        self.paths = PathStore(out_dir, toplevel, path_capacity) if path_capacity > 0 else None
+
+    def submit_isa(self, bundle, commits=None):
+        """Start the Spike run of a compiled test on the ISA pool"""
+        if commits is None:
+            commits = not self.tiers.screen_first()
+        template = templates[bundle.sim_input.get_template()]
+        bundle.isa_future = self.isa_pool.submit(bundle.isa_input, bundle.it,
+                                                 bundle.assert_intr, commits, template)
+
+    def screened(self, bundle, novel):
+        """Screening verdict of a test, novel ones get their full Spike run"""
+        if bundle.isa_future is None:
+            return
+        (_, isa_trace) = bundle.isa_future.result()
+        if isa_trace is not None and not isa_trace.commits:
+            self.tiers.record_screen(novel)
+            if novel:
+                self.submit_isa(bundle, commits=True)
 
     @coroutine
-    def execute(self, sim_input, data, it, assert_intr=False):
-        """Execute test on ISA and RTL simulators, return mismatch + coverage"""
-        # 1. Run ISA simulation
-        isa_result, isa_csv = self.isa_sim.run_test(
-            sim_input.isa_input, self.out_dir, it, assert_intr
-        )
+    def execute(self, bundle):
+        """Execute a compiled test on ISA and RTL simulators, return mismatch + coverage"""
+        if not bundle.compiled():
+            return (False, 0)  # Compile failed; nothing to run
+        it = bundle.it
+
+        # 1. Run ISA simulation, usually already done on the pool
+        if bundle.isa_future is None:
+            self.submit_isa(bundle)
+        isa_result, isa_trace = bundle.isa_future.result()
+        if isa_result == SUCCESS and not isa_trace.commits:
+            # Only screened so far, the comparison needs the write-backs
+            self.submit_isa(bundle, commits=True)
+            isa_result, isa_trace = bundle.isa_future.result()
+        # Only written in debug mode
+        isa_files = [ record_path(self.scratch.path('trace', f'isa_{it}.log')),
+                      record_path(self.scratch.path('trace', f'isa_{it}.csv')) ]
         if isa_result != SUCCESS:
+            self.scratch.discard(*isa_files)
             return (False, 0)  # ISA failed; skip RTL
+        # Traces cached before path fingerprints existed have none
+        path = getattr(isa_trace, 'path', None)
+        if self.paths is not None and self.paths.seen(path):
+            self.scratch.discard(*isa_files)
+            return (False, 0)  # Same path as a compared test; skip RTL
 
         # 2. Run RTL simulation
         rtl_result, coverage = yield self.rtl_sim.run_test(
-            sim_input.rtl_input, it
+            bundle.rtl_input, it
         )
+        # Written by the RTL tracer to the trace directory of the scratch space
+        rtl_log = self.scratch.path('trace', f'rtl_{it}.log')
         if rtl_result != SUCCESS:
+            self.scratch.discard(rtl_log, *isa_files)
             return (False, coverage)  # RTL failed; no mismatch
 
         # 3. Compare traces
-        rtl_log = f"{self.out_dir}/trace/rtl_{it}.log"
-        mismatch = trace_compare(isa_csv, rtl_log, self.toplevel)
-        return (mismatch == -1, coverage)  # True if mismatch
\ No newline at end of file
+        mismatch = trace_compare(isa_trace, rtl_log, self.toplevel)
+        if self.paths is not None and mismatch == 0:
+            # Only a comparison that completed clean clears the path, a
+            # mismatching or unfinished one is checked again
+            self.paths.add(path)
+        if mismatch == -1:
+            os.makedirs(f"{self.out_dir}/trace", exist_ok=True)
+            # Binary trace store, python -m execution.trace_store --to_csv gives the CSV
+            isa_trace.write_store(f"{self.out_dir}/trace/isa_{it}.trace")
+            if os.path.isfile(isa_files[0]):
+                self.scratch.keep(isa_files[0], f"{self.out_dir}/trace")
+            if os.path.isfile(rtl_log):
+                self.scratch.keep(rtl_log, f"{self.out_dir}/trace")
+        self.scratch.discard(rtl_log, *isa_files)
+        return (mismatch == -1, coverage)  # True if mismatch
+
+    def close(self):
+        self.isa_pool.close()
+        for line in self.isa_timeouts.report():
+            print(line)
+        if self.paths is not None:
+            print(self.paths.report())
+            self.paths.close()
+        self.scratch.close()
@@ -0,0 +1,53 @@
+""" PathStore: shared between workers, bounded by eviction
+"""
+import os
+
+from execution.path_store import PathStore
+
+def test_paths_are_shared(tmp_path):
+    store_path = str(tmp_path / 'paths.tbl')
+    first = PathStore(str(tmp_path), 'RocketTile', capacity=64, ways=4, store_path=store_path)
+    second = PathStore(str(tmp_path), 'RocketTile', capacity=64, ways=4, store_path=store_path)
+    try:
+        assert not second.seen(0x1234)
+        first.add(0x1234)
+        assert second.seen(0x1234)
+        # A trace without a path is never taken as seen
+        first.add(None)
+        assert not second.seen(None)
+        # 0 marks an empty slot, the path 0 is still stored
+        first.add(0)
+        assert second.seen(0)
+    finally:
+        first.close()
+        second.close()
+
+def test_full_set_evicts_one_way(tmp_path):
+    store = PathStore(str(tmp_path), 'RocketTile', capacity=16, ways=4,
+                      store_path=str(tmp_path / 'paths.tbl'))
+    try:
+        # Same set: key % 4 sets
+        keys = [ 4 * i for i in range(1, 6) ]
+        for key in keys:
+            store.add(key)
+        assert store.seen(keys[-1])
+        assert sum(store.seen(key) for key in keys[:-1]) == 3
+        # Other sets are untouched
+        store.add(5)
+        assert store.seen(5)
+        assert sum(store.seen(key) for key in keys) == 4
+    finally:
+        store.close()
+
+def test_store_is_per_rtl_build(tmp_path):
+    rocket = PathStore(str(tmp_path), 'RocketTile', capacity=64, ways=4)
+    boom = PathStore(str(tmp_path), 'BoomTile', capacity=64, ways=4)
+    try:
+        assert rocket.path != boom.path
+        rocket.add(0x1234)
+        assert not boom.seen(0x1234)
+    finally:
+        rocket.close()
+        boom.close()
+        for path in [rocket.path, boom.path]:
+            os.unlink(path)
@@ -0,0 +1,127 @@
+""" Toolchain
+Runs gcc, elf2hex and nm on a test without going through the output
+directory. The assembly is streamed to gcc on stdin and every other file of
+the test (.si, .elf, .hex, .intr) lives in an anonymous memfd, reachable by
+the simulators and tools through its /proc/<pid>/fd/<n> path, or in the
+scratch space where memfds are not available. Files are only written to
+out/tests when a test is kept (corpus, mismatch, illegal, error), under the
+same names the in-place flow used.
+"""
+
+import os
+import shutil
+import subprocess
+
+def has_memfd():
+    return hasattr(os, 'memfd_create') and os.path.isdir('/proc/self/fd')
+
+def fd_path(fd):
+    # Through the pid, not /proc/self, so that child processes can open it
+    return '/proc/{}/fd/{}'.format(os.getpid(), fd)
+
+
+class testFiles():
+    def __init__(self, test_dir, stem, in_memory=True, scratch=None):
+        self.test_dir = test_dir
+        self.stem = stem
+        self.in_memory = in_memory and has_memfd()
+        # Without memfds, files go to the scratch space if there is one
+        self.scratch = None if self.in_memory else scratch
+
+        self.fds = {}
+        self.texts = {}
+        self.written = set()
+        self.kept = False
+
+    def disk_path(self, ext):
+        return os.path.join(self.test_dir, self.stem + ext)
+
+    def scratch_path(self, ext):
+        if self.scratch is None:
+            return self.disk_path(ext)
+        self.written.add(ext)
+        return self.scratch.path('tests', self.stem + ext)
+
+    def path(self, ext):
+        """Path of the file with the given extension, created on first use"""
+        if not self.in_memory:
+            return self.scratch_path(ext)
+        if ext not in self.fds:
+            self.fds[ext] = os.memfd_create(self.stem + ext)
+        return fd_path(self.fds[ext])
+
+    def put(self, ext, text):
+        """Record a file no tool reads, it is only written if the test is kept"""
+        if self.in_memory:
+            self.texts[ext] = text
+        else:
+            with open(self.scratch_path(ext), 'w') as fd:
+                fd.write(text)
+
+    def keep(self):
+        """Write the files of the test to the test directory"""
+        if self.kept or not (self.in_memory or self.scratch):
+            return
+        os.makedirs(self.test_dir, exist_ok=True)
+        for ext in self.written:
+            if os.path.isfile(self.scratch_path(ext)):
+                shutil.copyfile(self.scratch_path(ext), self.disk_path(ext))
+        for (ext, fd) in self.fds.items():
+            if os.fstat(fd).st_size == 0:
+                continue
+            with open(fd_path(fd), 'rb') as src, open(self.disk_path(ext), 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        for (ext, text) in self.texts.items():
+            with open(self.disk_path(ext), 'w') as dst:
+                dst.write(text)
+        self.kept = True
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        if self.scratch is not None:
+            self.scratch.discard(*[ self.scratch_path(ext) for ext in self.written ])
+        self.fds = {}
+        self.texts = {}
+        self.written = set()
+
+    def __del__(self):
+        self.close()
+
+
+class Toolchain():
+    def __init__(self, cc_args, elf2hex_args, admission):
+        self.cc_args = cc_args
+        self.elf2hex_args = elf2hex_args
+        self.admission = admission
+
+    def compile(self, assembly, extra_args, files, template):
+        """Assemble and link the assembly into files' .elf, return gcc's exit code"""
+        files.put('.S', assembly)
+        if not files.in_memory:
+            cc_args = self.cc_args + extra_args + [files.scratch_path('.S'),
+                                                   '-o', files.path('.elf')]
+            return self.admission.run(cc_args, template)
+
+        # Input language set last, extra C sources of V_U keep theirs
+        cc_args = self.cc_args + extra_args + ['-x', 'assembler-with-cpp', '-',
+                                               '-o', files.path('.elf')]
+        return self.admission.run(cc_args, template, stdin=assembly.encode())
+
+    def elf2hex(self, files):
+        args = self.elf2hex_args + [files.path('.elf'), '--output', files.path('.hex')]
+        return subprocess.call(args)
+
+    def symbols(self, files):
+        """Symbol table of files' .elf read by nm"""
+        out = subprocess.run(['nm', files.path('.elf')], stdout=subprocess.PIPE,
+                             universal_newlines=True).stdout
+        if not files.in_memory:
+            files.put('.symbols', out)
+
+        symbols = {}
+        for line in out.splitlines():
+            parts = line.split()
+            if len(parts) >= 3:
+                symbols[parts[2]] = int(parts[0], 16)
+        return symbols
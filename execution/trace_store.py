@@ -0,0 +1,251 @@
+""" Trace store
+Binary columnar form of the 17-column trace CSV, for traces that are kept
+(mismatches, debugging, regression baselines). Every row is a fixed-width
+record: pc and the CSR vector as uint64s, the instruction word, the first
+write-back as register and value, the privilege mode, and indices into a
+string table that holds each distinct disassembly, operand and write-back
+list once. Readers mmap the file and see the records as a NumPy structured
+array when NumPy is installed, through struct otherwise.
+
+  header | records | string table (NUL-terminated UTF-8)
+
+Conversion to and from the CSV is lossless: hex columns keep their printed
+width, values that are not lowercase hex go to the string table.
+
+  python -m execution.trace_store --csv isa_1.csv --store isa_1.trace
+  python -m execution.trace_store --store isa_1.trace --csv isa_1.csv --to_csv
+"""
+
+import csv
+import mmap
+import struct
+import argparse
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from execution.isa_trace import CSV_FIELDS
+from common.compression import open_trace
+
+MAGIC = b'PFTRACE\0'
+VERSION = 1
+
+# magic, version, record size, records, string table offset, string table size
+HEADER = struct.Struct('<8sIIQQQ')
+
+# Hex columns and the number of digits their type holds
+HEX_FIELDS = [ ('pc', 16), ('binary', 8) ] + [ (name, 16) for name in CSV_FIELDS[9:] ]
+STR_FIELDS = [ 'instr', 'gpr', 'csr', 'instr_str', 'operand', 'pad' ]
+
+# Width of a hex value: 0 for an empty string, RAW when the value is a
+# string table index. The last width is the write-back value's.
+RAW = 255
+
+RECORD = struct.Struct('<' + ''.join('Q' if digits == 16 else 'I' for (_, digits) in HEX_FIELDS) +
+                       'Qi{}ib{}B'.format(len(STR_FIELDS), len(HEX_FIELDS) + 1))
+
+DTYPE = [ (name, '<u8' if digits == 16 else '<u4') for (name, digits) in HEX_FIELDS ] + \
+        [ ('wb_val', '<u8'), ('wb_reg', '<i4') ] + \
+        [ (name, '<i4') for name in STR_FIELDS ] + \
+        [ ('mode', 'i1'), ('width', 'u1', (len(HEX_FIELDS) + 1,)) ]
+
+NONE = -1
+
+def is_hex(s, digits=16):
+    return len(s) <= digits and not s.strip('0123456789abcdef')
+
+
+class TraceStoreWriter():
+    def __init__(self, path):
+        self.path = path
+        self.fd = open(path, 'wb')
+        self.fd.write(b'\0' * HEADER.size)
+        self.count = 0
+        self.strings = {}
+
+    def intern(self, s):
+        if s == '':
+            return NONE
+        n = self.strings.get(s)
+        if n is None:
+            n = self.strings[s] = len(self.strings)
+        return n
+
+    def add(self, row):
+        """Append a row, a dict or a list in CSV_FIELDS order"""
+        if not isinstance(row, dict):
+            row = dict(zip(CSV_FIELDS, row))
+
+        values = []
+        widths = []
+        for (name, digits) in HEX_FIELDS:
+            s = row.get(name) or ''
+            if is_hex(s, digits):
+                values.append(int(s, 16) if s else 0)
+                widths.append(len(s))
+            else:
+                values.append(self.intern(s))
+                widths.append(RAW)
+
+        # First write-back, e.g. a0:0000000000000001;mstatus:..., only the
+        # rest of the list goes to the string table
+        (wb_reg, wb_val, wb_width) = (NONE, 0, 0)
+        gpr = row.get('gpr') or ''
+        first = gpr.split(';')[0]
+        (reg, _, val) = first.partition(':')
+        if reg and val and is_hex(val):
+            (wb_reg, wb_val, wb_width) = (self.intern(reg), int(val, 16), len(val))
+            gpr = gpr[len(first):]
+
+        mode = row.get('mode') or ''
+        if mode and not (mode.isdigit() and int(mode) < 128):
+            raise ValueError('Mode {} of row {} does not fit the trace store'.format(mode, self.count))
+
+        strings = [ self.intern(gpr if name == 'gpr' else row.get(name) or '')
+                    for name in STR_FIELDS ]
+        self.fd.write(RECORD.pack(*values, wb_val, wb_reg, *strings,
+                                  int(mode) if mode else NONE, *widths, wb_width))
+        self.count += 1
+
+    def close(self):
+        if self.fd is None:
+            return
+        offset = HEADER.size + self.count * RECORD.size
+        table = b''.join(s.encode() + b'\0' for s in self.strings)
+        self.fd.write(table)
+        self.fd.seek(0)
+        self.fd.write(HEADER.pack(MAGIC, VERSION, RECORD.size, self.count, offset, len(table)))
+        self.fd.close()
+        self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TraceStore():
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fd:
+            self.mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, size, count, offset, length) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION or size != RECORD.size:
+            self.mm.close()
+            raise ValueError('{} is not a version {} trace store'.format(path, VERSION))
+        self.count = count
+        self.strings = bytes(self.mm[offset:offset + length]).decode().split('\0')[:-1]
+
+    def __len__(self):
+        return self.count
+
+    def string(self, n):
+        return '' if n == NONE else self.strings[n]
+
+    def record(self, n):
+        """Raw record n, fields in DTYPE order with the widths flattened"""
+        if not 0 <= n < self.count:
+            raise IndexError(n)
+        return RECORD.unpack_from(self.mm, HEADER.size + n * RECORD.size)
+
+    def records(self):
+        view = memoryview(self.mm)[HEADER.size:HEADER.size + self.count * RECORD.size]
+        try:
+            for record in RECORD.iter_unpack(view):
+                yield record
+        finally:
+            view.release()
+
+    def array(self):
+        """Records as a NumPy structured array over the mapping, None without NumPy.
+        The array is a view: the mapping stays open until the array is dropped"""
+        if np is None:
+            return None
+        return np.frombuffer(self.mm, dtype=np.dtype(DTYPE), count=self.count,
+                             offset=HEADER.size)
+
+    def column(self, name):
+        """One numeric column, as an array with NumPy and a list otherwise"""
+        array = self.array()
+        if array is not None:
+            # A copy, it outlives the store
+            return array[name].copy()
+        n = [ field[0] for field in DTYPE ].index(name)
+        return [ record[n] for record in self.records() ]
+
+    def _row(self, record):
+        nhex = len(HEX_FIELDS)
+        widths = record[-nhex - 1:]
+        row = {}
+        for (i, (name, _)) in enumerate(HEX_FIELDS):
+            if widths[i] == RAW:
+                row[name] = self.string(record[i])
+            elif widths[i] == 0:
+                row[name] = ''
+            else:
+                row[name] = '{:0{}x}'.format(record[i], widths[i])
+        for (i, name) in enumerate(STR_FIELDS):
+            row[name] = self.string(record[nhex + 2 + i])
+        if record[nhex + 1] != NONE:
+            row['gpr'] = '{}:{:0{}x}'.format(self.string(record[nhex + 1]), record[nhex],
+                                             widths[-1]) + row['gpr']
+        mode = record[nhex + 2 + len(STR_FIELDS)]
+        row['mode'] = '' if mode == NONE else str(mode)
+        return row
+
+    def row(self, n):
+        """Row n as a dict keyed by CSV_FIELDS"""
+        return self._row(self.record(n))
+
+    def rows(self):
+        for record in self.records():
+            yield self._row(record)
+
+    def close(self):
+        try:
+            self.mm.close()
+        except BufferError:
+            # Arrays of array() still use the mapping, it is unmapped with the last of them
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def csv_to_store(csv_path, store_path):
+    with open_trace(csv_path, 'r', newline='') as fd, TraceStoreWriter(store_path) as store:
+        for row in csv.DictReader(fd):
+            store.add(row)
+    return store_path
+
+def store_to_csv(store_path, csv_path):
+    with TraceStore(store_path) as store, open_trace(csv_path, 'w', newline='') as fd:
+        writer = csv.DictWriter(fd, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(store.rows())
+    return csv_path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", type=str, help="Trace CSV")
+    parser.add_argument("--store", type=str, help="Binary trace store")
+    parser.add_argument("--to_csv", action="store_true",
+                        help="Convert the store to CSV instead of the CSV to a store")
+    args = parser.parse_args()
+
+    if args.to_csv:
+        store_to_csv(args.store, args.csv)
+    else:
+        csv_to_store(args.csv, args.store)
+
+
+if __name__ == "__main__":
+    main()
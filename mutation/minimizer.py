@@ -5,7 +5,9 @@ from copy import deepcopy
 from cocotb.decorators import coroutine
 from execution.rtl_simulator import ILL_MEM, SUCCESS, TIME_OUT, ASSERTION_FAIL
 from mutation.word import PREFIX, MAIN, SUFFIX  # Updated path
-from common.utils import debug_print  # Updated path
+from common.utils import debug_print, run_isa_test, ISA_TIME_LIMIT  # Updated path
+from execution.isa_timeouts import IsaTimeouts
+from mutation.mutator import templates
 from execution.multicore_manager import proc_state  # Updated path
 
 @coroutine
@@ -21,6 +23,8 @@ def Minimize(dut, toplevel,
 
     in_dir = out + '/mismatch/sim_input'
     stop = [ proc_state.NORMAL ]
+    # Spike limits per template, learned over the minimizer's runs
+    isa_timeouts = IsaTimeouts(default=ISA_TIME_LIMIT)
 
     min_dir = out + '/mismatch/min_input'
     if not os.path.isdir(min_dir):
@@ -95,7 +99,9 @@ def Minimize(dut, toplevel,
                     (isa_input, rtl_input, symbols) = preprocessor.process(tmp_input, data, assert_intr)
 
                     if isa_input and rtl_input:
-                        ret = run_isa_test(isaHost, isa_input, stop, out, proc_num)
+                        template = templates[tmp_input.get_template()]
+                        ret = run_isa_test(isaHost, isa_input, stop, out, proc_num,
+                                           timeouts=isa_timeouts, template=template)
                         if ret == proc_state.ERR_ISA_TIMEOUT: continue
 
                         try:
@@ -107,7 +113,8 @@ def Minimize(dut, toplevel,
                         if assert_intr and ret == SUCCESS:
                             (intr_prv, epc) = checker.check_intr(isa_input, rtl_input, epc)
                             if epc != 0:
-                                ret = run_isa_test(isaHost, isa_input, stop, out, proc_num, True)
+                                ret = run_isa_test(isaHost, isa_input, stop, out, proc_num, True,
+                                                   timeouts=isa_timeouts, template=template)
                                 if ret == proc_state.ERR_ISA_TIMEOUT: continue
                             else: continue
 
@@ -331,77 +331,93 @@ BASE_RE = re.compile(
     r"(?P<rd>[a-z0-9]+?),(?P<imm>[\-0-9]*?)\((?P<rs1>[a-z0-9]+?)\)")
 
 
+# Pseudo instructions that only append an operand: name -> (instruction, operand)
+PSEUDO_APPEND = {
+    "mv"      : ("addi",    "0"),
+    "not"     : ("xori",    "-1"),
+    "sext.w"  : ("addiw",   "0"),
+    "seqz"    : ("sltiu",   "1"),
+    "sltz"    : ("slt",     "zero"),
+    "csrr"    : ("csrrw",   "zero"),
+    "zext.b"  : ("andi",    "255"),
+    # TODO: support for RV64B
+    "zext.h"  : ("pack",    "zero"),
+    "zext.w"  : ("pack",    "zero"),
+}
+
+# RV32B pseudo instructions: instruction -> (name, immediate) list
+# TODO: support "rev", "orc", and "zip/unzip" instructions for RV64
+PSEUDO_RV32B = [
+    ("grevi",   [("rev.p", 1), ("rev2.n", 2), ("rev.n", 3), ("rev4.b", 4),
+                 ("rev2.b", 6), ("rev.b", 7), ("rev8.h", 8), ("rev4.h", 12),
+                 ("rev2.h", 14), ("rev.h", 15), ("rev16", 16), ("rev8", 24),
+                 ("rev4", 28), ("rev2", 30), ("rev", 31)]),
+    ("gorci",   [("orc.p", 1), ("orc2.n", 2), ("orc.n", 3), ("orc4.b", 4),
+                 ("orc2.b", 6), ("orc.b", 7), ("orc8.h", 8), ("orc4.h", 12),
+                 ("orc2.h", 14), ("orc.h", 15), ("orc16", 16), ("orc8", 24),
+                 ("orc4", 28), ("orc2", 30), ("orc", 31)]),
+    ("shfli",   [("zip.n", 1), ("zip2.b", 2), ("zip.b", 3), ("zip4.h", 4),
+                 ("zip2.h", 6), ("zip.h", 7), ("zip8", 8), ("zip4", 12),
+                 ("zip2", 14), ("zip", 15)]),
+    ("unshfli", [("unzip.n", 1), ("unzip2.b", 2), ("unzip.b", 3), ("unzip4.h", 4),
+                 ("unzip2.h", 6), ("unzip.h", 7), ("unzip8", 8), ("unzip4", 12),
+                 ("unzip2", 14), ("unzip", 15)])]
+
+PSEUDO_APPEND.update({ name: (instr, str(imm))
+                       for (instr, imms) in PSEUDO_RV32B for (name, imm) in imms })
+
+# Pseudo instructions whose first operand is zero: name -> instruction
+PSEUDO_PREPEND = {
+    "blez"  : "bge",
+    "bgtz"  : "blt",
+    "csrw"  : "csrrw",
+    "csrs"  : "csrrs",
+    "csrc"  : "csrrc",
+    "csrwi" : "csrrwi",
+    "csrsi" : "csrrsi",
+    "csrci" : "csrrci",
+}
+
+# Pseudo instructions with zero as second operand: name -> instruction
+PSEUDO_ZERO_RS = {
+    "neg"  : "sub",
+    "negw" : "subw",
+    "snez" : "sltu",
+    "sgtz" : "slt",
+    "beqz" : "beq",
+    "bnez" : "bne",
+    "bgez" : "bge",
+    "bltz" : "blt",
+}
+
+# Branches with swapped sources: name -> instruction
+PSEUDO_SWAP = {
+    "bgt"  : "blt",
+    "ble"  : "bge",
+    "bgtu" : "bltu",
+    "bleu" : "bgeu",
+}
+
+
 def convert_pseudo_instr(instr_name, operands, binary):
     """Convert pseudo instruction to regular instruction"""
-    if instr_name == "nop":
-        instr_name = "addi"
-        operands = "zero,zero,0"
-    elif instr_name == "mv":
-        instr_name = "addi"
-        operands = operands + ",0"
-    elif instr_name == "not":
-        instr_name = "xori"
-        operands = operands + ",-1"
-    elif instr_name == "neg":
-        instr_name = "sub"
-        o = operands.split(",")
-        operands = o[0] + ",zero," + o[1]
-    elif instr_name == "negw":
-        instr_name = "subw"
-        o = operands.split(",")
-        operands = o[0] + ",zero," + o[1]
-    elif instr_name == "sext.w":
-        instr_name = "addiw"
-        operands = operands + ",0"
-    elif instr_name == "seqz":
-        instr_name = "sltiu"
-        operands = operands + ",1"
-    elif instr_name == "snez":
-        instr_name = "sltu"
-        o = operands.split(",")
-        operands = o[0] + ",zero," + o[1]
-    elif instr_name == "sltz":
-        instr_name = "slt"
-        operands = operands + ",zero"
-    elif instr_name == "sgtz":
-        instr_name = "slt"
-        o = operands.split(",")
-        operands = o[0] + ",zero," + o[1]
-    elif instr_name in ["beqz", "bnez", "bgez", "bltz"]:
-        instr_name = instr_name[0:3]
-        o = operands.split(",")
-        operands = o[0] + ",zero," + o[1]
-    elif instr_name == "blez":
-        instr_name = "bge"
+    if instr_name in PSEUDO_APPEND:
+        (instr_name, operand) = PSEUDO_APPEND[instr_name]
+        operands = operands + "," + operand
+    elif instr_name in PSEUDO_PREPEND:
+        instr_name = PSEUDO_PREPEND[instr_name]
         operands = "zero," + operands
-    elif instr_name == "bgtz":
-        instr_name = "blt"
-        operands = "zero," + operands
-    elif instr_name == "bgt":
-        instr_name = "blt"
-        o = operands.split(",")
-        operands = o[1] + "," + o[0] + "," + o[2]
-    elif instr_name == "ble":
-        instr_name = "bge"
-        o = operands.split(",")
-        operands = o[1] + "," + o[0] + "," + o[2]
-    elif instr_name == "bgtu":
-        instr_name = "bltu"
+    elif instr_name in PSEUDO_ZERO_RS:
+        instr_name = PSEUDO_ZERO_RS[instr_name]
         o = operands.split(",")
-        operands = o[1] + "," + o[0] + "," + o[2]
-    elif instr_name == "bleu":
-        instr_name = "bgeu"
+        operands = o[0] + ",zero," + o[1]
+    elif instr_name in PSEUDO_SWAP:
+        instr_name = PSEUDO_SWAP[instr_name]
         o = operands.split(",")
         operands = o[1] + "," + o[0] + "," + o[2]
-    elif instr_name == "csrr":
-        instr_name = "csrrw"
-        operands = operands + ",zero"
-    elif instr_name in ["csrw", "csrs", "csrc"]:
-        instr_name = "csrr" + instr_name[3:]
-        operands = "zero," + operands
-    elif instr_name in ["csrwi", "csrsi", "csrci"]:
-        instr_name = "csrr" + instr_name[3:]
-        operands = "zero," + operands
+    elif instr_name == "nop":
+        instr_name = "addi"
+        operands = "zero,zero,0"
     elif instr_name == "jr":
         instr_name = "jalr"
         operands = "zero,{},0".format(operands)
@@ -427,169 +443,4 @@ def convert_pseudo_instr(instr_name, operands, binary):
         else:
             instr_name = "jalr"
             operands = "zero,ra,0"
-    # RV32B pseudo instructions
-    # TODO: support "rev", "orc", and "zip/unzip" instructions for RV64
-    elif instr_name == "rev.p":
-        instr_name = "grevi"
-        operands += ",1"
-    elif instr_name == "rev2.n":
-        instr_name = "grevi"
-        operands += ",2"
-    elif instr_name == "rev.n":
-        instr_name = "grevi"
-        operands += ",3"
-    elif instr_name == "rev4.b":
-        instr_name = "grevi"
-        operands += ",4"
-    elif instr_name == "rev2.b":
-        instr_name = "grevi"
-        operands += ",6"
-    elif instr_name == "rev.b":
-        instr_name = "grevi"
-        operands += ",7"
-    elif instr_name == "rev8.h":
-        instr_name = "grevi"
-        operands += ",8"
-    elif instr_name == "rev4.h":
-        instr_name = "grevi"
-        operands += ",12"
-    elif instr_name == "rev2.h":
-        instr_name = "grevi"
-        operands += ",14"
-    elif instr_name == "rev.h":
-        instr_name = "grevi"
-        operands += ",15"
-    elif instr_name == "rev16":
-        instr_name = "grevi"
-        operands += ",16"
-    elif instr_name == "rev8":
-        instr_name = "grevi"
-        operands += ",24"
-    elif instr_name == "rev4":
-        instr_name = "grevi"
-        operands += ",28"
-    elif instr_name == "rev2":
-        instr_name = "grevi"
-        operands += ",30"
-    elif instr_name == "rev":
-        instr_name = "grevi"
-        operands += ",31"
-    elif instr_name == "orc.p":
-        instr_name = "gorci"
-        operands += ",1"
-    elif instr_name == "orc2.n":
-        instr_name = "gorci"
-        operands += ",2"
-    elif instr_name == "orc.n":
-        instr_name = "gorci"
-        operands += ",3"
-    elif instr_name == "orc4.b":
-        instr_name = "gorci"
-        operands += ",4"
-    elif instr_name == "orc2.b":
-        instr_name = "gorci"
-        operands += ",6"
-    elif instr_name == "orc.b":
-        instr_name = "gorci"
-        operands += ",7"
-    elif instr_name == "orc8.h":
-        instr_name = "gorci"
-        operands += ",8"
-    elif instr_name == "orc4.h":
-        instr_name = "gorci"
-        operands += ",12"
-    elif instr_name == "orc2.h":
-        instr_name = "gorci"
-        operands += ",14"
-    elif instr_name == "orc.h":
-        instr_name = "gorci"
-        operands += ",15"
-    elif instr_name == "orc16":
-        instr_name = "gorci"
-        operands += ",16"
-    elif instr_name == "orc8":
-        instr_name = "gorci"
-        operands += ",24"
-    elif instr_name == "orc4":
-        instr_name = "gorci"
-        operands += ",28"
-    elif instr_name == "orc2":
-        instr_name = "gorci"
-        operands += ",30"
-    elif instr_name == "orc":
-        instr_name = "gorci"
-        operands += ",31"
-    elif instr_name == "zext.b":
-        instr_name = "andi"
-        operands += ",255"
-    elif instr_name == "zext.h":
-        # TODO: support for RV64B
-        instr_name = "pack"
-        operands += ",zero"
-    elif instr_name == "zext.w":
-        instr_name = "pack"
-        operands += ",zero"
-    elif instr_name == "sext.w":
-        instr_name = "addiw"
-        operands += ",0"
-    elif instr_name == "zip.n":
-        instr_name = "shfli"
-        operands += ",1"
-    elif instr_name == "unzip.n":
-        instr_name = "unshfli"
-        operands += ",1"
-    elif instr_name == "zip2.b":
-        instr_name = "shfli"
-        operands += ",2"
-    elif instr_name == "unzip2.b":
-        instr_name = "unshfli"
-        operands += ",2"
-    elif instr_name == "zip.b":
-        instr_name = "shfli"
-        operands += ",3"
-    elif instr_name == "unzip.b":
-        instr_name = "unshfli"
-        operands += ",3"
-    elif instr_name == "zip4.h":
-        instr_name = "shfli"
-        operands += ",4"
-    elif instr_name == "unzip4.h":
-        instr_name = "unshfli"
-        operands += ",4"
-    elif instr_name == "zip2.h":
-        instr_name = "shfli"
-        operands += ",6"
-    elif instr_name == "unzip2.h":
-        instr_name = "unshfli"
-        operands += ",6"
-    elif instr_name == "zip.h":
-        instr_name = "shfli"
-        operands += ",7"
-    elif instr_name == "unzip.h":
-        instr_name = "unshfli"
-        operands += ",7"
-    elif instr_name == "zip8":
-        instr_name = "shfli"
-        operands += ",8"
-    elif instr_name == "unzip8":
-        instr_name = "unshfli"
-        operands += ",8"
-    elif instr_name == "zip4":
-        instr_name = "shfli"
-        operands += ",12"
-    elif instr_name == "unzip4":
-        instr_name = "unshfli"
-        operands += ",12"
-    elif instr_name == "zip2":
-        instr_name = "shfli"
-        operands += ",14"
-    elif instr_name == "unzip2":
-        instr_name = "unshfli"
-        operands += ",14"
-    elif instr_name == "zip":
-        instr_name = "shfli"
-        operands += ",15"
-    elif instr_name == "unzip":
-        instr_name = "unshfli"
-        operands += ",15"
     return instr_name, operands
@@ -2,11 +2,14 @@ import time
 import random
 from mutation.mutator import rvMutator
 from execution.test_executor import TestExecutor
+from execution.compile_farm import CompileFarm
+from execution.isa_screen import IsaScreen
 from coverage.corpus_manager import CorpusManager
 from coverage.coverage_tracker import CoverageTracker
 from common.config import parse_args
 from common.constants import ROCKET, BOOM
-from common.utils import debug_print
+from common.utils import debug_print, share_transitions
+from coverage.csr_vector import preset as csr_preset, masked, parse_masks
 
 def main():
     args = parse_args()
@@ -27,21 +30,55 @@ def main():
         multicore=args.multicore > 1
     )
 
+    # Transitions found by any worker, or by an earlier run in args.out, are not new
+    transitions = share_transitions(args.out)
+
     # Initialize DUT and executor (simplified for example)
     dut = None  # In real use, load Verilated DUT
     executor = TestExecutor(
-        dut, args.toplevel, args.out, debug=args.debug
+        dut, args.toplevel, args.out, debug=args.debug,
+        scratch_root=args.scratch_root,
+        isa_workers=args.isa_workers,
+        isa_cache_mb=args.isa_cache_mb,
+        path_capacity=args.path_capacity
+    )
+
+    # Compile ahead of the simulators, the loop only pops compiled tests
+    farm = CompileFarm(
+        executor.preprocessor,
+        num_workers=args.compile_workers,
+        depth=args.compile_depth,
+        on_compiled=executor.submit_isa
+    )
+    source = lambda n: mutator.get(n) + (False,)
+
+    # Only tests whose Spike run adds transitions reach RTL, most novel first
+    screen = IsaScreen(
+        farm, args.out,
+        all_csr=args.all_csr,
+        fp_csr=args.fp_csr,
+        width=args.screen_width,
+        on_screened=executor.screened,
+        vector=masked(csr_preset(args.all_csr, args.fp_csr), parse_masks(args.csr_mask))
     )
 
     # Fuzzing loop
     start_time = time.time()
-    for it in range(args.num_iter):
-        # 1. Generate/mutate test
-        sim_input, data = mutator.get(it)
-        debug_print(f"Generated test {it}", args.debug)
+    next_it = 0
+    while True:
+        # 1. Generate/mutate tests until the farm is full
+        next_it = farm.fill(source, next_it, args.num_iter - 1)
+        if not screen.ready() and not farm.empty():
+            screen.pull()
+            continue
+        bundle = screen.get()
+        if bundle is None:
+            break
+        it = bundle.it
+        debug_print(f"Screened test {it}: Transitions={bundle.transitions}", args.debug)
 
         # 2. Execute test
-        mismatch, coverage = executor.execute(sim_input, data, it)
+        mismatch, coverage = executor.execute(bundle)
 
         # 3. Update coverage and corpus
         coverage_tracker.update_from_rtl(coverage)
@@ -53,7 +90,19 @@ def main():
 
         # Save to corpus if new coverage is found
         if coverage > 0:
-            corpus.add_test(sim_input)
+            corpus.add_test(bundle.sim_input)
+
+        # Test files only reach the disk for tests worth keeping
+        if mismatch or coverage > 0:
+            bundle.keep()
+        bundle.close()
+    screen.close()
+    farm.close()
+    executor.close()
+    for line in transitions.report():
+        print(line)
+    # Saved to args.out by the last worker out
+    transitions.close()
 
     # Finalize
     if args.multicore > 1: